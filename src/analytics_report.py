@@ -0,0 +1,84 @@
+"""Analytics report.
+
+Merges the analytics of every session written to a directory by `python -m src.main --analytics DIR`, and prints
+a summary: how many games were played, how they ended and the hottest spots of each heatmap. Also writes the merged
+heatmaps to merged.npz in the directory, and draws them to heatmaps.png if matplotlib is installed.
+
+Run from the repository root with:
+    python -m src.analytics_report DIR
+"""
+import argparse
+import os
+from collections import Counter
+
+import numpy as np
+from src.tools import add_headless_argument, use_headless
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory the game wrote its analytics to')
+    parser.add_argument('--top', type=int, default=3, help='hottest spots to show of each heatmap')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+
+    # Imported here so the headless option is respected
+    from src.game.analytics import Analytics, merge_sessions
+
+    heatmaps, events, sessions = merge_sessions(args.directory)
+    kinds = Counter(event['kind'] for event in events)
+    print(f'{sessions} sessions, {kinds["start"]} games, {kinds["death"]} ended by a kill wall')
+    print('Events: ' + ', '.join(f'{kind} {amount}' for kind, amount in kinds.most_common()))
+    deaths = [event['score'] for event in events if event['kind'] == 'death']
+    if deaths:
+        print(f'Score at death: mean {np.mean(deaths):.1f}, median {np.median(deaths):.0f}, best {max(deaths)}')
+
+    size = Analytics.BIN_SIZE
+    for layer, heatmap in heatmaps.items():
+        total = heatmap.sum()
+        if not total:
+            continue
+        hottest = np.argsort(heatmap, axis=None)[::-1][:args.top]
+        spots = ', '.join(f'({column * size}-{(column + 1) * size}, {row * size}-{(row + 1) * size}) '
+                          f'{heatmap[row, column] / total:.1%}'
+                          for row, column in zip(*np.unravel_index(hottest, heatmap.shape)) if heatmap[row, column])
+        print(f'{layer:>8}: {total} in total, hottest {spots}')
+
+    merged = os.path.join(args.directory, 'merged.npz')
+    np.savez_compressed(merged, bin_size=size, **heatmaps)
+    print(f'Wrote merged heatmaps to {merged}')
+    chart = os.path.join(args.directory, 'heatmaps.png')
+    if plot(chart, heatmaps):
+        print(f'Wrote heatmaps to {chart}')
+
+
+def plot(filename, heatmaps):
+    """Draws every heatmap to filename. Returns False if matplotlib isn't installed."""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib not installed, skipping heatmaps')
+        return False
+
+    fig, axes = plt.subplots(2, 3, figsize=(15, 8))
+    for ax, (layer, heatmap) in zip(axes.flat, heatmaps.items()):
+        # The first row of a heatmap is the bottom of the window
+        ax.imshow(heatmap, origin='lower', cmap='inferno')
+        ax.set_title(layer)
+        ax.set_xticks([])
+        ax.set_yticks([])
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+    return True
+
+
+if __name__ == '__main__':
+    main()
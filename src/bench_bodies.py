@@ -0,0 +1,157 @@
+"""Physics body type benchmark.
+
+Steps a space filled like a busy game (pawns chasing the player, sliders bouncing back and forth across the
+window and pellets lying around) twice, and reports how long the physics steps of a tick take each time:
+    dynamic:   pellets and sliders have dynamic bodies, pellets get their velocity zeroed and sliders get
+               teleported every tick (how it used to be done)
+    kinematic: pellets and sliders have kinematic bodies, sliders are driven by setting their velocity
+               (how it's done now)
+
+Run from the repository root with:
+    python -m src.bench_bodies
+"""
+import argparse
+import random
+import time
+
+import pymunk
+import pytweening
+
+from src.tools import add_headless_argument, use_headless
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pawns', type=int, default=100, help='number of pawns')
+    parser.add_argument('--sliders', type=int, default=10, help='number of sliders')
+    parser.add_argument('--pellets', type=int, default=50, help='number of pellets')
+    parser.add_argument('--ticks', type=int, default=600, help='ticks to measure for each body type')
+    parser.add_argument('--seed', type=int, default=0, help='random seed so both body types get the same layout')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+
+    # Imported here so the headless option is respected
+    from src.game import TPS, SUBSTEPS, Profiler
+
+    profiler = Profiler(history=args.ticks)
+    for body_type in ('dynamic', 'kinematic'):
+        random.seed(args.seed)
+        bench = Bench(args, kinematic=body_type == 'kinematic')
+        for _ in range(args.ticks):
+            bench.tick(1 / TPS)
+            start = time.perf_counter()
+            for _ in range(SUBSTEPS):
+                bench.space.step(1 / TPS)
+            profiler.record(body_type, time.perf_counter() - start)
+
+    print(f'{args.pawns} pawns, {args.sliders} sliders, {args.pellets} pellets, '
+          f'{SUBSTEPS} steps per tick, {args.ticks} ticks')
+    for body_type in ('dynamic', 'kinematic'):
+        stats = ', '.join(f'{stat} {value:.3f} ms' for stat, value in profiler.summary(body_type).items())
+        print(f'{body_type:>9}: {stats}')
+
+
+class Bench:
+    """A physics space set up the same way GameWindow, Pellet and the enemies set up theirs."""
+
+    def __init__(self, args, kinematic):
+        # Imported here so the headless option is respected
+        from src.game import WIDTH, HEIGHT, SUBSTEPS, CollisionType
+
+        self.kinematic = kinematic
+        self.substeps = SUBSTEPS
+        self.space = pymunk.Space()
+
+        for a, b in (((0, 0), (WIDTH, 0)), ((WIDTH, 0), (WIDTH, HEIGHT)),
+                     ((WIDTH, HEIGHT), (0, HEIGHT)), ((0, HEIGHT), (0, 0))):
+            wall = pymunk.Segment(self.space.static_body, a, b, 0.0)
+            wall.collision_type = CollisionType.WallSensor
+            wall.filter = pymunk.ShapeFilter(categories=CollisionType.WallSensor)
+            self.space.add(wall)
+
+        enemy_mask = pymunk.ShapeFilter.ALL_MASKS ^ CollisionType.WallSensor ^ CollisionType.WallKill
+
+        def add_box(size, collision_type, mask, mass, pos):
+            if mass is None:
+                body = pymunk.Body(body_type=pymunk.Body.KINEMATIC)
+            else:
+                body = pymunk.Body(mass, pymunk.moment_for_box(mass, size))
+            body.position = pos
+            shape = pymunk.Poly.create_box(body, size, 1)
+            shape.collision_type = collision_type
+            shape.filter = pymunk.ShapeFilter(categories=collision_type, mask=mask)
+            self.space.add(body, shape)
+            return body
+
+        def random_pos(margin):
+            return random.uniform(margin, WIDTH - margin), random.uniform(margin, HEIGHT - margin)
+
+        self.player = add_box((32, 32), CollisionType.Player,
+                              pymunk.ShapeFilter.ALL_MASKS ^ CollisionType.WallSensor, 50, (WIDTH / 2, HEIGHT / 2))
+        self.pawns = [add_box((32, 32), CollisionType.EnemyPawn, enemy_mask, 10, random_pos(16))
+                      for _ in range(args.pawns)]
+        self.pellets = [add_box((16, 16), CollisionType.Pellet,
+                                pymunk.ShapeFilter.ALL_MASKS ^ CollisionType.EnemyPawn,
+                                None if kinematic else 50, random_pos(175))
+                        for _ in range(args.pellets)]
+        # Sliders bounce back and forth across the window at a random height and a random point in their move
+        self.sliders = []
+        for _ in range(args.sliders):
+            y = random.uniform(64, HEIGHT - 64)
+            body = add_box((128, 128), CollisionType.EnemySlider, enemy_mask, None if kinematic else 500, (64, y))
+            self.sliders.append([body, pymunk.Vec2d(64, y), pymunk.Vec2d(WIDTH - 64, y), random.random()])
+
+        def push(arbiter, slider, pushee):
+            _body, start, end, _t = slider
+            pushee.body.position += (end - start).normalized() * abs(arbiter.contact_point_set.points[0].distance)
+
+        def find_slider(shape):
+            return next(slider for slider in self.sliders if slider[0] is shape.body)
+
+        def player_slider(arbiter, _space, _data):
+            push(arbiter, find_slider(arbiter.shapes[1]), arbiter.shapes[0])
+            return False
+
+        def pellet_slider(arbiter, _space, _data):
+            slider = find_slider(arbiter.shapes[1])
+            near_end = (slider[2] - slider[0].position).length < 128
+            if not kinematic:
+                return near_end
+            if near_end:
+                push(arbiter, slider, arbiter.shapes[0])
+            return False
+
+        self.space.add_collision_handler(CollisionType.Player, CollisionType.Pellet).pre_solve = lambda *_: False
+        self.space.add_collision_handler(CollisionType.Player, CollisionType.EnemySlider).pre_solve = player_slider
+        self.space.add_collision_handler(CollisionType.Pellet, CollisionType.EnemySlider).pre_solve = pellet_slider
+
+    def tick(self, dt):
+        self.player.velocity = (0, 0)
+        for pawn in self.pawns:
+            pawn.velocity = (self.player.position - pawn.position).normalized() * 10
+
+        for slider in self.sliders:
+            body, start, end, t = slider
+            t += dt
+            if t >= 1:
+                # Turn around
+                start, end, t = end, start, 0
+            target = start + (end - start) * pytweening.easeOutBounce(t)
+            if self.kinematic:
+                body.velocity = (target - body.position) / (dt * self.substeps)
+            else:
+                body.position = target
+            slider[1:] = start, end, t
+
+        if not self.kinematic:
+            for pellet in self.pellets:
+                pellet.velocity = (0, 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Memory footprint of game entities.
+
+Creates a few thousand of each kind of entity (pellets, pawns, sliders and turrets, like the level would) and
+reports how many bytes of python memory each one takes, measured with tracemalloc, along with how that's split:
+    instance:   the object itself, including its __slots__
+    __dict__:   the instance dictionary (which sprites always have) and how many attributes are in it
+    total:      everything allocated per entity, so also the sprite's vertex list, the body, the shape and any
+                animation playing on it
+Memory that chipmunk allocates for bodies and shapes in C isn't seen by tracemalloc, so it isn't included.
+
+Run from the repository root with:
+    python -m src.footprint
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from src.tools import add_headless_argument, use_headless
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='entities of each kind to create')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+
+    # Imported here so the headless option is respected
+    from pyglet.graphics import Batch
+    from src.game import Pellet, EnemyPawn, EnemySlider, EnemyTurret, animator
+
+    batch = Batch()
+
+    def create(kind, i):
+        pos = (i % 1000, i // 1000)
+        if kind is Pellet:
+            return Pellet(pos=pos, batch=batch)
+        return kind(pos=pos, player=None, spatial=None, projectiles=None, batch=batch)
+
+    def delete(entities):
+        for entity in entities:
+            animator.stop(entity)
+            entity.delete()
+        entities.clear()
+        gc.collect()
+
+    print(f'{"":>12}{"instance":>10}{"__dict__":>10}{"attributes":>12}{"slots":>8}{"total":>10}')
+    tracemalloc.start()
+    for kind in (Pellet, EnemyPawn, EnemySlider, EnemyTurret):
+        # Create and delete them once first, so the batch's buffers have already grown big enough for them
+        entities = [create(kind, i) for i in range(args.count)]
+        delete(entities)
+
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        entities = [create(kind, i) for i in range(args.count)]
+        gc.collect()
+        total = (tracemalloc.get_traced_memory()[0] - before) / args.count
+
+        entity = entities[0]
+        slots = sum(len(getattr(cls, '__slots__', ())) for cls in type(kind).mro(kind))
+        print(f'{kind.__name__:>12}{sys.getsizeof(entity):>10}{sys.getsizeof(entity.__dict__):>10}'
+              f'{len(entity.__dict__):>12}{slots:>8}{total:>10.0f}')
+        delete(entities)
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
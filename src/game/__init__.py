@@ -2,11 +2,26 @@
 from .constants import *
 from .resources import *
 from .utils import *
+from .profiling import Profiler, profiler
+from .tracing import Tracer
+from .gc_policy import GCPolicy
+from .animation import Animator, animator, spin, hue_ramp
+from .key_input import KeyInput, InputLatency
+from .analytics import Analytics, analytics, merge_sessions
 from .game_object import GameObject
+from .event_bus import EventBus
 from .actor import Actor
 from .player import Player
+from .spatial import SpatialQueries
 from .game_ui import GameUI
+from .particles import ParticleSystem, Emitter, PELLET_PICKUP, SLIDER_SLAM
 from .pellet import Pellet
+from .projectiles import ProjectileStore
 from .enemy import *
+from .waves import Waves, compile_waves, load_waves
 from .level import Level
+from .leaderboard import Leaderboard, LeaderboardView
 from .menu import Menu
+from .scene import Scene
+from .rewind import Rewind
+from .spectator import SpectatorPublisher
@@ -1,14 +1,24 @@
+import math
+
 import pymunk
 from pymunk.vec2d import Vec2d
 from pyglet.sprite import Sprite
 
+from .constants import WIDTH, HEIGHT
 from .game_object import GameObject
 
 
 # We need GameObject first here, which according to python's rules about the MRO and since we were
 # careful to put a super().__init__() call in GameObject. __init__() which will then call Sprite.__init__()
 class Actor(GameObject, Sprite):
-    """A GameObject which is also a sprite and has a physical body and shape."""
+    """A GameObject which is also a sprite and has a physical body and shape.
+
+    Sprite has no __slots__, so actors still get a __dict__ for the sprite's own attributes, but ours go in slots."""
+    __slots__ = ('body', 'shape', 'cull_radius')
+    # Whether the body ever moves after it's created, things that don't are left alone by the occupancy grid (see
+    # SpatialQueries)
+    moves = True
+
     def __init__(self, *args, body: pymunk.Body, shape: pymunk.Shape, pos, **kwargs):
         # Make sure our pos is a vec2d
         pos = Vec2d(pos)
@@ -21,11 +31,31 @@ class Actor(GameObject, Sprite):
         self.pos = pos
         # Add a custom owner attribute to shape to make collisions easier
         self.shape.owner = self
+        # Half the diagonal of the image, if the body is further than this outside the window
+        # then no matter how the sprite is rotated it can't be seen
+        self.cull_radius = math.hypot(self.width, self.height) / 2
+
+    def sync_sprite(self) -> bool:
+        """Moves the sprite to where the body is, or hides it if it would be outside the window.
+
+        Returns whether the sprite is visible. Hidden sprites don't get their vertices updated."""
+        x, y = self.body.position
+        radius = self.cull_radius
+        if x < -radius or x > WIDTH + radius or y < -radius or y > HEIGHT + radius:
+            if self.visible:
+                self.visible = False
+            return False
+        if not self.visible:
+            self.visible = True
+        # Update both x and y at once, so the vertices are only recalculated once
+        self.update(x=x, y=y)
+        return True
+
+    def activate(self):
+        self.visible = True
 
-    def tick(self, dt: float):
-        # Make sure the internal Sprite has the same pos as body
-        self.x = self.body.position.x
-        self.y = self.body.position.y
+    def deactivate(self):
+        self.visible = False
 
     @property
     def pos(self) -> Vec2d:
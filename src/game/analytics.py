@@ -0,0 +1,217 @@
+"""Gameplay analytics: where the player, enemies and pellets spend their time, and where things happen.
+
+Positions are binned into heatmaps (NumPy 2D histograms over the window, allocated once) and discrete events
+(pickups, deaths, slider slams and key rebinds) are logged. Everything is written to a directory by a background
+thread, as a compressed event log and a file of heatmaps per session, and merge_sessions() adds up every session
+written to a directory (see src/analytics_report.py).
+
+Analytics are off unless start() is called, then event() and collect() return right away."""
+import gzip
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from . import WIDTH, HEIGHT, profiler
+
+
+class Analytics:
+    """Collects heatmaps and events, and hands them to a writer thread."""
+    # Size of a heatmap bin in px
+    BIN_SIZE = 16
+    # Heatmaps of where things are every tick (in ticks spent in each bin)
+    TICK_LAYERS = ('player', 'enemies', 'pellets')
+    # Heatmaps of where events happened, by the kind of event
+    EVENT_LAYERS = {'pickup': 'pickups', 'death': 'deaths', 'slam': 'slams'}
+    LAYERS = TICK_LAYERS + tuple(EVENT_LAYERS.values())
+    # Average time per tick that collecting positions may take, if it takes longer we collect less often
+    BUDGET = 0.0002
+    # But never less often than every this many ticks
+    MAX_STRIDE = 30
+    # Ticks between handing the logged events to the writer
+    FLUSH_INTERVAL = 60
+
+    def __init__(self):
+        self.enabled = False
+        self.columns = math.ceil(WIDTH / self.BIN_SIZE)
+        self.rows = math.ceil(HEIGHT / self.BIN_SIZE)
+        # One layer per name in LAYERS
+        self.heatmaps = np.zeros((len(self.LAYERS), self.rows, self.columns), dtype=np.uint32)
+        # Events since the last flush, as dicts that are written as a line of JSON each
+        self.events = []
+        # Games started this session, and ticks since the current one started
+        self.game = 0
+        self.ticks = 0
+        # Positions are collected every stride ticks (and count for that many ticks)
+        self.stride = 1
+        self._countdown = 1
+        self._tick_layers = {layer: index for index, layer in enumerate(self.TICK_LAYERS)}
+        self._writer = None
+
+    def start(self, directory):
+        """Starts collecting, and writing everything to files in directory."""
+        os.makedirs(directory, exist_ok=True)
+        session = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+        self._writer = _Writer(os.path.join(directory, session))
+        self.enabled = True
+
+    def begin_game(self):
+        if not self.enabled:
+            return
+        self.game += 1
+        self.ticks = 0
+        self.event('start')
+
+    def end_game(self):
+        """Hands the events and heatmaps so far to the writer, so nothing is lost if the game crashes later."""
+        if not self.enabled:
+            return
+        self.flush()
+        self._writer.put(('heatmaps', self.heatmaps.copy()))
+
+    def flush(self):
+        """Hands the events logged so far to the writer."""
+        if self.events:
+            self._writer.put(('events', self.events))
+            self.events = []
+
+    def event(self, kind, pos=None, **data):
+        """Logs an event that happened at pos (if it happened somewhere), with any extra data."""
+        if not self.enabled:
+            return
+        event = {'game': self.game, 'tick': self.ticks, 'kind': kind}
+        if pos is not None:
+            x, y = pos
+            event['x'] = round(x, 1)
+            event['y'] = round(y, 1)
+            layer = self.EVENT_LAYERS.get(kind)
+            if layer is not None:
+                self.heatmaps[self.LAYERS.index(layer), self._row(y), self._column(x)] += 1
+        event.update(data)
+        self.events.append(event)
+
+    def _row(self, y):
+        return min(max(int(y // self.BIN_SIZE), 0), self.rows - 1)
+
+    def _column(self, x):
+        return min(max(int(x // self.BIN_SIZE), 0), self.columns - 1)
+
+    def collect(self, objects):
+        """Bins the position of every object with a heatmap layer. Called every tick of a game."""
+        if not self.enabled:
+            return
+        self.ticks += 1
+        if self.ticks % self.FLUSH_INTERVAL == 0:
+            self.flush()
+        self._countdown -= 1
+        if self._countdown > 0:
+            return
+
+        start = time.perf_counter()
+        xs = []
+        ys = []
+        layers = []
+        for obj in objects:
+            layer = obj.heatmap
+            if layer is not None:
+                # Bodies rather than sprites, since sprites aren't moved while they're off screen
+                x, y = obj.body.position
+                xs.append(x)
+                ys.append(y)
+                layers.append(self._tick_layers[layer])
+        if xs:
+            columns = np.clip(np.array(xs) // self.BIN_SIZE, 0, self.columns - 1).astype(np.intp)
+            rows = np.clip(np.array(ys) // self.BIN_SIZE, 0, self.rows - 1).astype(np.intp)
+            # Every tick layer at once, as if they were a single long heatmap
+            bins = (np.array(layers) * self.rows + rows) * self.columns + columns
+            tick_heatmaps = self.heatmaps[:len(self.TICK_LAYERS)]
+            counts = np.bincount(bins, minlength=tick_heatmaps.size).reshape(tick_heatmaps.shape)
+            # Each sample stands in for every tick since the last one
+            tick_heatmaps += (counts * self.stride).astype(np.uint32)
+        elapsed = time.perf_counter() - start
+
+        # Spread the cost out so it averages out to at most BUDGET per tick
+        self.stride = min(max(math.ceil(elapsed / self.BUDGET), 1), self.MAX_STRIDE)
+        self._countdown = self.stride
+        profiler.sample('analytics.stride', self.stride)
+
+    def close(self):
+        """Writes everything that's left and waits for the writer to finish."""
+        if not self.enabled:
+            return
+        self.end_game()
+        self._writer.close()
+        self.enabled = False
+
+
+class _Writer:
+    """Writes events and heatmaps to files starting with path in a thread of its own."""
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='analytics', daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def _run(self):
+        with gzip.open(self.path + '.events.jsonl.gz', 'wt') as events:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, data = item
+                if kind == 'events':
+                    events.writelines(json.dumps(event) + '\n' for event in data)
+                    # So the log can be read while the game is still running
+                    events.flush()
+                else:
+                    # Written next to the old one and then moved over it, so there's always a whole file
+                    np.savez_compressed(self.path + '.heatmaps.tmp.npz', bin_size=Analytics.BIN_SIZE,
+                                        **dict(zip(Analytics.LAYERS, data)))
+                    os.replace(self.path + '.heatmaps.tmp.npz', self.path + '.heatmaps.npz')
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+def merge_sessions(directory):
+    """Adds up the heatmaps and collects the events of every session written to directory.
+
+    Returns (heatmaps by layer name, events, number of sessions). Sessions written with another BIN_SIZE are
+    skipped."""
+    heatmaps = {layer: np.zeros((math.ceil(HEIGHT / Analytics.BIN_SIZE), math.ceil(WIDTH / Analytics.BIN_SIZE)),
+                                dtype=np.uint64)
+                for layer in Analytics.LAYERS}
+    events = []
+    sessions = 0
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.endswith('.heatmaps.npz'):
+            with np.load(path) as data:
+                if data['bin_size'] != Analytics.BIN_SIZE:
+                    continue
+                for layer in Analytics.LAYERS:
+                    heatmaps[layer] += data[layer]
+            sessions += 1
+        elif filename.endswith('.events.jsonl.gz'):
+            session = filename[:-len('.events.jsonl.gz')]
+            try:
+                with gzip.open(path, 'rt') as f:
+                    for line in f:
+                        events.append({'session': session, **json.loads(line)})
+            except (EOFError, json.JSONDecodeError):
+                # The game is still running (or crashed), so the end of the log isn't there yet
+                pass
+    return heatmaps, events, sessions
+
+
+# Shared by everything, like the profiler
+analytics = Analytics()
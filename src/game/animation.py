@@ -0,0 +1,103 @@
+"""Purely cosmetic animations (spinning pellets, color ramps, blinking keys) evaluated right before drawing.
+
+Instead of updating sprites every tick, objects register a curve for a sprite attribute once. Each frame the
+animator evaluates every curve in a single pass just before the window is drawn, skipping sprites that are hidden
+(eg. culled for being outside the window), so none of this work happens in the simulation tick."""
+import math
+
+from . import make_color, valmap, profiler
+
+
+class _Animation:
+    __slots__ = ('curve', 'start', 'duration', 'then', 'value')
+
+    def __init__(self, curve, start, duration, then):
+        self.curve = curve
+        self.start = start
+        self.duration = duration
+        self.then = then
+        # Last value set, so unchanged values don't make the sprite recalculate its vertices
+        self.value = None
+
+
+class Animator:
+    """Keeps track of the animations of every object and applies them.
+
+    Time only moves when advance() is called (every game tick), so animations line up with the timers of the game."""
+
+    def __init__(self):
+        self.time = 0.0
+        # Object -> attribute -> _Animation
+        self.animations = {}
+
+    def advance(self, dt: float):
+        self.time += dt
+
+    def play(self, obj, attribute, curve, *, delay=0.0, duration=math.inf, then=None):
+        """Sets obj.attribute to curve(seconds since the animation started) every frame for duration seconds.
+
+        The animation starts after delay seconds, a negative delay starts it partway through. Once it's done
+        the attribute is set to then (unless that's None). Replaces any animation already playing on
+        obj.attribute, finishing it first."""
+        self.stop(obj, attribute)
+        self.animations.setdefault(obj, {})[attribute] = _Animation(curve, self.time + delay, duration, then)
+
+    def stop(self, obj, attribute=None):
+        """Finishes the animation of obj.attribute, or every animation of obj if attribute is None."""
+        animations = self.animations.get(obj)
+        if animations is None:
+            return
+        for name in ([attribute] if attribute is not None else list(animations)):
+            animation = animations.pop(name, None)
+            if animation is not None and animation.then is not None:
+                setattr(obj, name, animation.then)
+        if not animations:
+            del self.animations[obj]
+
+    def clear(self):
+        """Forgets every animation without finishing them."""
+        self.animations.clear()
+
+    def apply(self):
+        """Evaluates the animations of every visible object. Called right before drawing."""
+        time = self.time
+        finished = []
+        evaluated = 0
+        for obj, animations in self.animations.items():
+            visible = getattr(obj, 'visible', True)
+            for attribute, animation in animations.items():
+                elapsed = time - animation.start
+                if elapsed < 0:
+                    continue
+                if elapsed >= animation.duration:
+                    finished.append((obj, attribute))
+                    continue
+                if not visible:
+                    continue
+                evaluated += 1
+                value = animation.curve(elapsed)
+                if value != animation.value:
+                    animation.value = value
+                    setattr(obj, attribute, value)
+        for obj, attribute in finished:
+            self.stop(obj, attribute)
+        profiler.sample('animations.evaluated', evaluated)
+
+
+# Shared by everything, like the profiler
+animator = Animator()
+
+
+def spin(degrees_per_second, start=0.0):
+    """Curve for a rotation that turns steadily forever."""
+    return lambda elapsed: (start + degrees_per_second * elapsed) % 360
+
+
+def hue_ramp(start_hue, end_hue, duration, steps=64):
+    """Curve for a color that goes from start_hue to end_hue (0-1) over duration, then stays at end_hue.
+
+    The colors are made up front, so evaluating the curve is only a lookup."""
+    colors = [tuple(int(x) for x in make_color(hue=valmap(step, 0, steps, start_hue, end_hue), saturation=1,
+                                               luminance=0.5))
+              for step in range(steps + 1)]
+    return lambda elapsed: colors[min(int(elapsed / duration * steps), steps)]
@@ -0,0 +1,205 @@
+"""Cache of pre-decoded images and pre-rendered glyphs.
+
+Decoding PNGs and rasterizing font glyphs on every launch is slow. Instead we do it once (the "bake" step) and
+write the resulting RGBA pixels, packed into a single atlas page, to one binary file together with the layout
+of the atlas. On the next launch the file is memory-mapped and uploaded straight to a texture.
+
+Only the glyphs drawn as sprites are baked (the key indicators next to the player, see resources.GLYPH_SETS). Labels
+(menus, score, highscores) still lay out text with pyglet's font system, which renders their glyphs at runtime, once
+per font size. resources.py keeps every font size that labels use loaded for the whole session, so each glyph is only
+ever rendered once, rather than again (into a new texture) whenever pyglet drops a font it isn't holding on to.
+
+The cache is keyed by a hash of the source files, so it's rebuilt automatically whenever one of them changes.
+It can also be rebuilt by hand with:
+    python -m src.game.asset_cache
+"""
+import os
+import mmap
+import json
+import struct
+import hashlib
+import ctypes
+
+import pyglet
+from pyglet import font
+from pyglet.image import ImageData
+
+# Where the source files live (absolute, so baking doesn't depend on pyglet's resource path)
+RESOURCES_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'resources'))
+# Where the cache is written
+CACHE_FILENAME = os.path.join(pyglet.resource.get_settings_path('WelcomeToHell'), 'assets.cache')
+
+# Bump this whenever the file format or the way things are baked changes
+FORMAT_VERSION = 1
+MAGIC = b'HELLASSETS'
+# Magic, format version and length of the JSON index
+HEADER = struct.Struct('<10sII')
+# Width of the atlas page and padding between images in it
+ATLAS_WIDTH = 512
+PADDING = 1
+
+
+class GlyphSet:
+    """Description of a set of glyphs to pre-render.
+
+    Each glyph is anchored so that a sprite is drawn exactly where a single character Label with
+    width=height=box_size, anchor_x='center', anchor_y='center' and align='center' would draw it."""
+
+    def __init__(self, name, font_file, font_name, font_size, characters, box_size):
+        self.name = name
+        self.font_file = font_file
+        self.font_name = font_name
+        self.font_size = font_size
+        self.characters = characters
+        self.box_size = box_size
+
+
+def _cache_key(images, glyph_sets):
+    """Hash of everything the baked cache depends on."""
+    key = hashlib.sha256(f'{FORMAT_VERSION}'.encode())
+    files = set(images) | {glyph_set.font_file for glyph_set in glyph_sets}
+    for filename in sorted(files):
+        key.update(filename.encode())
+        with open(os.path.join(RESOURCES_DIR, filename), 'rb') as f:
+            key.update(f.read())
+    for glyph_set in glyph_sets:
+        key.update(repr((glyph_set.name, glyph_set.font_name, glyph_set.font_size, glyph_set.characters,
+                         glyph_set.box_size)).encode())
+    return key.hexdigest()
+
+
+def _decode_images(images):
+    """Decodes each image file, returning (name, width, height, RGBA bytes, anchor_x, anchor_y) for each."""
+    decoded = []
+    for filename in images:
+        image = pyglet.image.load(os.path.join(RESOURCES_DIR, filename)).get_image_data()
+        data = image.get_data('RGBA', image.width * 4)
+        # Anchored in the center
+        decoded.append((filename, image.width, image.height, data, image.width // 2, image.height // 2))
+    return decoded
+
+
+def _render_glyphs(glyph_set):
+    """Renders each character of a GlyphSet, returning the same tuples as _decode_images."""
+    font.add_file(os.path.join(RESOURCES_DIR, glyph_set.font_file))
+    glyph_font = font.load(glyph_set.font_name, glyph_set.font_size)
+    half = glyph_set.box_size / 2
+    rendered = []
+    for char in glyph_set.characters:
+        glyph = glyph_font.get_glyphs(char)[0]
+        # Glyphs are stored upside down in the font's atlas, so flip the rows to get a normal image
+        # They are also only an alpha mask, so make them white
+        alpha = glyph.get_image_data().get_data('RGBA', -glyph.width * 4)[3::4]
+        data = bytearray(b'\xff' * (len(alpha) * 4))
+        data[3::4] = alpha
+        left, bottom = glyph.vertices[:2]
+        # Such a Label ends up with its glyph right aligned to x + half and its baseline at y + half - ascent
+        rendered.append((f'{glyph_set.name}/{char}', glyph.width, glyph.height, data,
+                         round(glyph.advance - half - left), round(glyph_font.ascent - half - bottom)))
+    return rendered
+
+
+def _pack(entries):
+    """Simple shelf packer, returns the height of the page and {name: (x, y)}."""
+    positions = {}
+    x = y = shelf_height = 0
+    # Tallest first keeps the shelves tight
+    for name, width, height, *_ in sorted(entries, key=lambda entry: -entry[2]):
+        if x + width > ATLAS_WIDTH:
+            x = 0
+            y += shelf_height + PADDING
+            shelf_height = 0
+        positions[name] = (x, y)
+        x += width + PADDING
+        shelf_height = max(shelf_height, height)
+    # Round the height up to a power of two
+    page_height = 1
+    while page_height < y + shelf_height:
+        page_height *= 2
+    return page_height, positions
+
+
+def bake(images, glyph_sets, filename=CACHE_FILENAME):
+    """Decodes images and renders glyphs, packs them into an atlas page and writes it all to filename."""
+    entries = _decode_images(images)
+    for glyph_set in glyph_sets:
+        entries += _render_glyphs(glyph_set)
+    page_height, positions = _pack(entries)
+
+    # Copy every image into its place on the page
+    page = bytearray(ATLAS_WIDTH * page_height * 4)
+    layout = {}
+    for name, width, height, data, anchor_x, anchor_y in entries:
+        x, y = positions[name]
+        for row in range(height):
+            start = ((y + row) * ATLAS_WIDTH + x) * 4
+            page[start:start + width * 4] = data[row * width * 4:(row + 1) * width * 4]
+        layout[name] = [x, y, width, height, anchor_x, anchor_y]
+
+    index = json.dumps({
+        'key': _cache_key(images, glyph_sets),
+        'width': ATLAS_WIDTH,
+        'height': page_height,
+        'layout': layout,
+    }).encode()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    # Write to a temporary file first, so a half written cache is never picked up
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index)))
+        f.write(index)
+        f.write(page)
+    os.replace(filename + '.tmp', filename)
+
+
+def _load(key, filename):
+    """Uploads a baked cache to a texture, returns None if it's missing or out of date."""
+    try:
+        f = open(filename, 'rb')
+    except OSError:
+        return None
+    with f:
+        # ACCESS_COPY gives us a writable buffer (that is never written back), which ctypes needs
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) as data:
+            if len(data) < HEADER.size:
+                return None
+            magic, version, index_length = HEADER.unpack_from(data)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            index = json.loads(data[HEADER.size:HEADER.size + index_length])
+            if index['key'] != key:
+                return None
+            width, height = index['width'], index['height']
+            if len(data) < HEADER.size + index_length + width * height * 4:
+                return None
+            # Point straight into the mapped file rather than copying the pixels
+            pixels = (ctypes.c_ubyte * (width * height * 4)).from_buffer(data, HEADER.size + index_length)
+            texture = ImageData(width, height, 'RGBA', pixels).get_texture()
+            # The texture has its own copy now, so let go of the mapping
+            del pixels
+
+    regions = {}
+    for name, (x, y, region_width, region_height, anchor_x, anchor_y) in index['layout'].items():
+        region = texture.get_region(x, y, region_width, region_height)
+        region.anchor_x = anchor_x
+        region.anchor_y = anchor_y
+        regions[name] = region
+    return regions
+
+
+def load(images, glyph_sets, filename=CACHE_FILENAME):
+    """Returns {name: image} for every image file and every glyph (named "<glyph set>/<char>").
+
+    Bakes the cache first if it's missing or any of the source files changed."""
+    key = _cache_key(images, glyph_sets)
+    regions = _load(key, filename)
+    if regions is None:
+        bake(images, glyph_sets, filename)
+        regions = _load(key, filename)
+    return regions
+
+
+if __name__ == '__main__':
+    # Importing resources loads (and if needed bakes) the cache, so force a rebake afterwards
+    from src.game import resources
+    bake(resources.IMAGE_FILES, resources.GLYPH_SETS)
+    print(f'Baked assets to {CACHE_FILENAME}')
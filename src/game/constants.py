@@ -2,6 +2,10 @@
 
 SIZE = WIDTH, HEIGHT = (1280, 960)
 TPS = 60.0
+# How many times the physics space is stepped each tick
+SUBSTEPS = 10
+# Ticks per second while an idle scene (the menus) is shown, just enough for the menu's blinking
+IDLE_TPS = 20.0
 
 
 class CollisionType:
@@ -11,3 +15,4 @@ class CollisionType:
     Pellet = 2 ** 3
     EnemyPawn = 2 ** 4
     EnemySlider = 2 ** 5
+    EnemyTurret = 2 ** 6
@@ -1,3 +1,4 @@
+import math
 import random
 from typing import Optional
 
@@ -5,16 +6,28 @@ from pymunk.vec2d import Vec2d
 import pymunk
 import pytweening
 
-from . import Actor, resources, CollisionType, WIDTH, HEIGHT, make_color, valmap
+from . import Actor, resources, CollisionType, WIDTH, HEIGHT, SUBSTEPS, SLIDER_SLAM, animator, hue_ramp, profiler, \
+    analytics
+
+# Color while waiting to move or fire, from a pleasant screen color to more and more red the closer it gets
+# (will only tint the white part of the sprite)
+WAIT_COLORS = hue_ramp(110 / 360, 0, 3)
 
 
 class Enemy(Actor):
     """Base class for all the enemies"""
+    __slots__ = ('player', 'spatial', 'projectiles', 'particles')
     SIZE = Vec2d(0, 0)
+    heatmap = 'enemies'
 
-    def __init__(self, *, mass, size, img, pos, player, collision_type, batch=None, **kwargs):
+    def __init__(self, *, size, img, pos, player, spatial, collision_type, mass=None, projectiles=None, particles=None,
+                 batch=None, **kwargs):
         # Make a body and shape from the mass and size
-        body = pymunk.Body(mass, pymunk.moment_for_box(mass, size))
+        # Without a mass the body is kinematic, it only moves by its velocity and is never pushed by anything
+        if mass is None:
+            body = pymunk.Body(body_type=pymunk.Body.KINEMATIC)
+        else:
+            body = pymunk.Body(mass, pymunk.moment_for_box(mass, size))
         # Make sure to add a tiny radius to the box poly to make collision more efficient
         shape = pymunk.Poly.create_box(body, size, 1)
         # Assign correct collision type
@@ -26,40 +39,45 @@ class Enemy(Actor):
 
         # Hold on to some values we need
         self.player = player
-        self.size = Vec2d(size)
+        self.spatial = spatial
+        # Where to fire projectiles, for the enemies that do
+        self.projectiles = projectiles
+        # Where to show effects, for the enemies that have any
+        self.particles = particles
 
 
 class EnemyPawn(Enemy):
     """A small enemy that simply follows the player."""
+    __slots__ = ()
     SIZE = Vec2d(32, 32)
+    SPEED = 10
 
-    def __init__(self, *, pos, player, batch=None, **kwargs):
+    def __init__(self, *, pos, player, spatial, batch=None, **kwargs):
         super().__init__(mass=10, size=self.SIZE, img=resources.enemy_pawn_image, pos=pos, player=player,
-                         collision_type=CollisionType.EnemyPawn, batch=batch, **kwargs)
-        self.speed = 10
+                         spatial=spatial, collision_type=CollisionType.EnemyPawn, batch=batch, **kwargs)
 
     def tick(self, dt: float):
         super().tick(dt)
 
         # Find vector to player and set it as our velocity (accounting for speed)
-        vel = Vec2d(self.player.position) - Vec2d(self.position)
-        self.body.velocity = vel.normalized() * self.speed
+        # Use the bodies rather than the sprites, since sprites aren't moved while they're off screen
+        vel = self.spatial.vector_to_player(self.pos)
+        self.body.velocity = vel.normalized() * self.SPEED
 
 
 class EnemySlider(Enemy):
     """A big and fast enemy that slides towards the player, but only moves in a single cardinal direction at once."""
+    __slots__ = ('wait_timer', 'moving', 'start_pos', 'end_pos', 'move_timer', 'x_axis_preferred')
     SIZE = Vec2d(128, 128)
+    SPEED = 100
 
-    def __init__(self, *, pos, player, batch=None, **kwargs):
-        super().__init__(mass=500, size=self.SIZE, img=resources.enemy_slider_image, pos=pos, player=player,
-                         collision_type=CollisionType.EnemySlider, batch=batch, **kwargs)
-
-        # Start out in a pleasant screen color (will only tint the white part of the sprite)
-        self.color = make_color(hue=110 / 360, saturation=1, luminance=0.5)
-
-        self.speed = 100
+    def __init__(self, *, pos, player, spatial, batch=None, **kwargs):
+        # Kinematic, since we decide exactly where we are at all times
+        super().__init__(size=self.SIZE, img=resources.enemy_slider_image, pos=pos, player=player,
+                         spatial=spatial, collision_type=CollisionType.EnemySlider, batch=batch, **kwargs)
 
         self.wait_timer = 0
+        self.play_wait_colors()
         self.moving = False
         self.start_pos: Optional[Vec2d] = None
         self.end_pos: Optional[Vec2d] = None
@@ -88,13 +106,23 @@ class EnemySlider(Enemy):
         def player_collision_pre_solve(arbiter, space, data):
             # Find what is essentially *self* by looking at the owner of the EnemySlider shape that collided
             slider = arbiter.shapes[1].owner
-            push(arbiter, slider, arbiter.shapes[0])
+            with profiler.trace('collision Player/EnemySlider'):
+                push(arbiter, slider, arbiter.shapes[0])
             return False
 
         def pellet_collision_pre_solve(arbiter, space, data):
             # Find what is essentially *self* by looking at the owner of the EnemySlider shape that collided
             slider = arbiter.shapes[1].owner
-            return (slider.end_pos - slider.pos).length < 128
+            with profiler.trace('collision Pellet/EnemySlider'):
+                # Pellets and sliders are both kinematic so the solver won't separate them, push the pellet ourselves
+                if (slider.end_pos - slider.pos).length < 128:
+                    pellet = arbiter.shapes[0]
+                    push(arbiter, slider, pellet)
+                    # But never out of the window
+                    half = pellet.owner.cull_radius
+                    x, y = pellet.body.position
+                    pellet.body.position = (min(max(x, half), WIDTH - half), min(max(y, half), HEIGHT - half))
+            return False
 
         # Override player collision
         # We need this because standard pymunk collision likes to just push the player to the side
@@ -114,9 +142,6 @@ class EnemySlider(Enemy):
         # As long as we're not moving we want to calculate where we would like to move in the future
         # This is so we can rotate the sprite
         if not self.moving:
-            # Adjust color to be more red the closer wait_timer gets to 0
-            self.color = make_color(hue=valmap(self.wait_timer, 3, 0, 0, 110) / 360, saturation=1, luminance=0.5)
-
             # If we're not moving and we've been waiting for 3 sec
             if self.wait_timer > 3:
                 # Then move
@@ -126,38 +151,40 @@ class EnemySlider(Enemy):
             # Clear some vectors
             self.end_pos = Vec2d()
             self.start_pos = self.pos
-            # Find delta vector to player
-            delta = self.player.pos - self.pos
+            # Find delta vector to player and which way (if any) we could move to hit them
+            delta = self.spatial.vector_to_player(self.pos)
+            line_of_sight = self.spatial.line_of_sight(self.pos, 64)
 
-            # If we are able to hit the player by moving vertically
-            if -64 < delta.y < 64:
+            # If we are able to hit the player by moving horizontally
+            if line_of_sight == 'x':
                 # Don't move in y dir
                 self.end_pos.y = self.pos.y
                 # Move to the edge of the screen in the x dir (either left or right)
                 if delta.x > 0:
-                    self.end_pos.x = WIDTH - self.size.x / 2
+                    self.end_pos.x = WIDTH - self.SIZE.x / 2
                 else:
-                    self.end_pos.x = self.size.x / 2
-            # If we are able to hit the player by moving horizontally
-            elif -64 < delta.x < 64:
+                    self.end_pos.x = self.SIZE.x / 2
+            # If we are able to hit the player by moving vertically
+            elif line_of_sight == 'y':
                 # Don't move in x dir
                 self.end_pos.x = self.pos.x
                 # Move to the edge of the screen in the y dir (either top or bottom)
                 if delta.y > 0:
-                    self.end_pos.y = HEIGHT - self.size.y / 2
+                    self.end_pos.y = HEIGHT - self.SIZE.y / 2
                 else:
-                    self.end_pos.y = self.size.y / 2
+                    self.end_pos.y = self.SIZE.y / 2
             # If we are not able to hit the player
             else:
                 # Try to get in line with the player
                 if self.x_axis_preferred:
                     self.end_pos.y = self.pos.y
-                    self.end_pos.x = self.player.x
+                    self.end_pos.x = self.pos.x + delta.x
                 else:
                     self.end_pos.x = self.pos.x
-                    self.end_pos.y = self.player.y
+                    self.end_pos.y = self.pos.y + delta.y
 
-            # Rotate so we face the direction we want to move
+            # Rotate so we face the direction we want to move, even while culled, since this only happens when a move
+            # starts and we might slide into view during it
             # The 270 - angle is due to how the sprite is facing
             self.rotation = 270 - (self.start_pos - self.end_pos).angle_degrees
 
@@ -165,16 +192,102 @@ class EnemySlider(Enemy):
         if self.moving:
             # Increase the move timer by a small bit taking into account how long we need to move and at what speed
             # The 5 is simply a multiplier to make the speed feel approx equal to other speeds in the game
-            self.move_timer += dt * (5 / (self.end_pos.get_distance(self.start_pos) / self.speed))
-            # Change the position of the body according to a bounding algorithm
-            self.body.position = self.start_pos + (self.end_pos - self.start_pos) * pytweening.easeOutBounce(
+            self.move_timer += dt * (5 / (self.end_pos.get_distance(self.start_pos) / self.SPEED))
+            # Find where we should be at the end of this tick according to a bounding algorithm
+            target = self.start_pos + (self.end_pos - self.start_pos) * pytweening.easeOutBounce(
                 min(self.move_timer, 1))
+            # And move the body there over the physics steps of this tick
+            self.body.velocity = (target - self.pos) / (dt * SUBSTEPS)
             # Then if we're done moving
             if self.move_timer >= 1.0:
+                self._slam()
                 self.wait_timer = 0
+                self.play_wait_colors()
                 self.moving = False
                 # Maybe choose another preferred axis
                 self.x_axis_preferred = bool(random.getrandbits(1))
         else:
-            # Reset velocity so if we got pushed we stop
+            # Stand still while waiting
             self.body.velocity = (0, 0)
+
+    def play_wait_colors(self):
+        """Ramps our color towards red while waiting to move, starting wait_timer sec into the ramp."""
+        animator.play(self, 'color', WAIT_COLORS, delay=-self.wait_timer)
+
+    def _slam(self):
+        """Throws debris back from our front edge when we're done moving (and logs where for analytics)."""
+        if self.end_pos == self.start_pos:
+            return
+        direction = (self.end_pos - self.start_pos).normalized()
+        front = self.end_pos + Vec2d(direction.x * self.SIZE.x, direction.y * self.SIZE.y) / 2
+        analytics.event('slam', front)
+        if self.particles is not None:
+            self.particles.burst(SLIDER_SLAM, front, angle=direction.angle + math.pi, color=self.color)
+
+
+class EnemyTurret(Enemy):
+    """A stationary enemy that fires patterns of projectiles."""
+    __slots__ = ('wait_timer', 'pattern', 'spiral_shots', 'spiral_timer', 'angle')
+    SIZE = Vec2d(64, 64)
+    moves = False
+    PROJECTILE_SPEED = 15
+    PROJECTILE_LIFETIME = 10
+    # The patterns that are fired, one after the other
+    PATTERNS = ['ring', 'fan', 'spiral']
+
+    def __init__(self, *, pos, player, spatial, projectiles, batch=None, **kwargs):
+        # Kinematic, since it never moves
+        super().__init__(size=self.SIZE, img=resources.enemy_turret_image, pos=pos, player=player, spatial=spatial,
+                         projectiles=projectiles, collision_type=CollisionType.EnemyTurret, batch=batch, **kwargs)
+
+        # Time since the last pattern was fired
+        self.wait_timer = 0
+        self.pattern = random.randrange(len(self.PATTERNS))
+        # Spirals are fired a couple of projectiles at a time
+        self.spiral_shots = 0
+        self.spiral_timer = 0
+        # Turned a bit after every shot, so patterns don't always line up the same way
+        self.angle = 0.0
+
+        self.play_wait_colors()
+        # Face the player, the 90 - angle is due to the barrel pointing up in the sprite
+        animator.play(self, 'rotation', lambda _elapsed: 90 - self.spatial.vector_to_player(self.pos).angle_degrees)
+
+    def tick(self, dt: float):
+        super().tick(dt)
+
+        self.wait_timer += dt
+        if self.wait_timer > 3:
+            self.wait_timer = 0
+            self.play_wait_colors()
+            pattern = self.PATTERNS[self.pattern]
+            self.pattern = (self.pattern + 1) % len(self.PATTERNS)
+            if pattern == 'ring':
+                # Projectiles in every direction
+                self._fire([self.angle + math.tau * i / 24 for i in range(24)])
+            elif pattern == 'fan':
+                # A spread of projectiles towards the player
+                direction = self.spatial.vector_to_player(self.pos)
+                self._fire([direction.angle + 0.15 * i for i in range(-3, 4)])
+            else:
+                self.spiral_shots = 36
+            self.angle += math.radians(7.5)
+
+        # Fire the next shots of a spiral
+        if self.spiral_shots:
+            self.spiral_timer += dt
+            while self.spiral_timer >= 1 / 30 and self.spiral_shots:
+                self.spiral_timer -= 1 / 30
+                self.spiral_shots -= 1
+                self._fire([self.angle, self.angle + math.pi])
+                self.angle += math.radians(10)
+        else:
+            self.spiral_timer = 0
+
+    def play_wait_colors(self):
+        """Ramps our color towards red while waiting to fire, starting wait_timer sec into the ramp."""
+        animator.play(self, 'color', WAIT_COLORS, delay=-self.wait_timer)
+
+    def _fire(self, angles):
+        with profiler.trace('EnemyTurret.fire'):
+            self.projectiles.fire(self.pos, angles, self.PROJECTILE_SPEED, self.PROJECTILE_LIFETIME)
@@ -0,0 +1,51 @@
+from pyglet.event import EVENT_HANDLED, EVENT_UNHANDLED
+
+
+class EventBus:
+    """Routes input events from the window to the objects that subscribed to them.
+
+    Pushing every object's handlers onto the window's handler stack means every event walks the whole stack, and
+    taking them off again means searching it. Instead objects subscribe their event handlers (anything with methods
+    named after EVENTS, eg. on_text) here, each method only to its own event. Dispatching an event only calls the
+    methods subscribed to it, and everything an owner subscribed is unsubscribed at once when it dies or its scene is
+    deactivated.
+
+    Like pyglet's handler stack, the newest subscriptions are called first, and an event stops at the first handler
+    that returns EVENT_HANDLED."""
+    EVENTS = ('on_key_press', 'on_key_release', 'on_text', 'on_text_motion')
+
+    def __init__(self):
+        # Owner -> [(event, method)], in the order the owners subscribed
+        self._subscriptions = {}
+        # Event -> the methods to call, newest subscription first
+        # Only rebuilt when subscriptions change, which is a lot less often than events are dispatched
+        self._handlers = {event: () for event in self.EVENTS}
+
+    def subscribe(self, owner, handlers):
+        """Subscribes the methods of each handler in handlers to their events, until owner is unsubscribed."""
+        methods = [(event, getattr(handler, event)) for handler in handlers for event in self.EVENTS
+                   if hasattr(handler, event)]
+        if not methods:
+            return
+        self._subscriptions.setdefault(owner, []).extend(methods)
+        self._rebuild({event for event, _ in methods})
+
+    def unsubscribe(self, owner):
+        """Unsubscribes everything owner subscribed."""
+        methods = self._subscriptions.pop(owner, None)
+        if methods:
+            self._rebuild({event for event, _ in methods})
+
+    def _rebuild(self, events):
+        for event in events:
+            self._handlers[event] = tuple(method for methods in reversed(self._subscriptions.values())
+                                          for subscribed, method in reversed(methods) if subscribed == event)
+
+    def dispatch(self, event, *args):
+        """Calls the methods subscribed to event with args, until one of them handles it."""
+        # The handlers can subscribe and unsubscribe (eg. by switching scenes), but that replaces the tuple we're
+        # going through rather than changing it
+        for method in self._handlers[event]:
+            if method(*args):
+                return EVENT_HANDLED
+        return EVENT_UNHANDLED
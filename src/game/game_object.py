@@ -1,23 +1,46 @@
 class GameObject:
-    """Base object for all objects in the game that needs to be ticked and be able to die."""
+    """Base object for all objects in the game that needs to be ticked and be able to die.
+
+    There can be thousands of enemies and pellets, so the per object state is kept small: attributes live in
+    __slots__ where possible, and the lists that are empty for almost every object start out as a shared empty tuple
+    until an object actually needs its own."""
+    __slots__ = ('dead', 'new_objects')
+    # Whether the object changes by itself over time, idle scenes (see Scene) are only ticked while something
+    # is animating
+    animating = False
+    # Name of the analytics heatmap (see Analytics.TICK_LAYERS) the position of the object is binned into, if any
+    heatmap = None
+    # Event handlers to subscribe to the window's EventBus (objects that have any assign their own list)
+    event_handlers = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         # Flag to remove this object from the game_object list
         self.dead = False
-
-        # List of new objects to go in the game_objects list after the tick
-        self.new_objects = []
-
-        # Tell the game handler about any event handlers
-        self.event_handlers = []
+        # New objects to go in the game_objects list after the tick (see spawn())
+        self.new_objects = ()
 
     def tick(self, dt: float):
         pass
 
+    def spawn(self, *objects):
+        """Adds objects to the game after the current tick."""
+        if not self.new_objects:
+            self.new_objects = []
+        self.new_objects.extend(objects)
+
     def die(self):
         self.dead = True
 
+    def activate(self):
+        """Called when the Scene this object is part of becomes active."""
+        pass
+
+    def deactivate(self):
+        """Called when the Scene this object is part of stops being active (and when first added to it)."""
+        pass
+
     def delete(self):
         # Needed because Actor uses multiple inheritance and the MRO is a little funky
         # We need the hasattr since GameObject could be a non-actor that doesn't necessarily have a delete()
@@ -1,25 +1,26 @@
-import math
-
 from pyglet.sprite import Sprite
 from pyglet.text import Label
-from pymunk.vec2d import Vec2d
-import pymunk
 
-from . import GameObject, WIDTH, HEIGHT, resources, valmap, Player, CollisionType
+from . import GameObject, WIDTH, HEIGHT, resources, valmap, Player, SpatialQueries, animator
 
 
 class GameUI(GameObject):
     """In game UI that shows score etc."""
 
-    def __init__(self, *, player: Player, space: pymunk.Space, ui_batch=None, background_batch=None):
+    def __init__(self, *, player: Player, spatial: SpatialQueries, ui_batch=None, background_batch=None):
         super().__init__()
 
         self.player = player
-        self.space = space
+        self.spatial = spatial
         self.background_batch = background_batch
 
         self.danger_sprite = Sprite(img=resources.danger_image, batch=background_batch, x=128, y=128)
         self.danger_sprite.visible = False
+        # Where and how visible the danger sprite should be, worked out every tick but only shown when drawing
+        self.danger_position = (128, 128)
+        self.danger_opacity = 0
+        animator.play(self.danger_sprite, 'position', lambda _elapsed: self.danger_position)
+        animator.play(self.danger_sprite, 'opacity', lambda _elapsed: self.danger_opacity)
 
         # Internal score modified by the property below
         self._score = 0
@@ -39,36 +40,33 @@ class GameUI(GameObject):
 
     def tick(self, dt: float):
         # Don't show danger sprite by default
-        self.danger_sprite.visible = False
-        # Okay so to find out where to possibly show the danger sprite
-        # We need to do a ray cast from the center of the map to the player
-        # And when we hit a wall, that is where it would be shown if it is close enough to the player
-        # The reason we need this, is that the logic for snapping from the players position to a wall position
-        # without raycasting in the case of corners (where two walls meet) is quite complicated so this is simply easier
+        self.danger_opacity = 0
+        # Find where the player would hit the wall if they kept running away from the center of the map
+        # That is where the danger sprite is shown if it is close enough to the player
+        wall_point = self.spatial.nearest_wall_point(self.player.pos)
+        # We can't find it if the player hasn't moved away from the center
+        if wall_point is not None:
+            # Find our distance to it
+            distance = self.spatial.distance_to_player(wall_point)
+            # And if our distance is less than half of danger_sprite's width/height
+            if distance < self.danger_sprite.width / 2:
+                # Show the sprite with increasing opacity as player nears wall
+                self.danger_opacity = min(valmap(distance, self.danger_sprite.width / 2, 0, 0, 255), 255)
+                self.danger_position = (wall_point.x, wall_point.y)
+
+    def reset(self):
+        """Get ready for a new game."""
+        self.score = 0
+        self.danger_opacity = 0
 
-        # get some preliminary start and end points
-        start = Vec2d(WIDTH, HEIGHT) / 2
-        end = (self.player.pos - start)
-        # We can't divide by 0, so make sure the player has moved away from the center
-        if end.get_length_sqrd() > 0:
-            # Then set the length to be the diagonal of the screen, so that the ray will always hit a wall somewhere
-            end.length = math.sqrt(WIDTH ** 2 + HEIGHT ** 2)
-            # Remove the start as we don't want vector relative to the center of the screen but rather proper coords
-            end += start
-            # Raycast, finding only wall sensors
-            results = self.space.segment_query(start, end, 1, pymunk.ShapeFilter(mask=CollisionType.WallSensor))
-            # If we hit something
-            if results:
-                # Find our distance to it
-                wall_result = results[0]
-                distance = (self.player.pos - wall_result.point).length
-                # And if our distance is less than half of danger_sprite's width/height
-                if distance < self.danger_sprite.width / 2:
-                    # Show the sprite with increasing opacity as player nears wall
-                    self.danger_sprite.visible = True
-                    self.danger_sprite.opacity = min(valmap(distance, self.danger_sprite.width / 2, 0, 0, 255), 255)
-                    self.danger_sprite.x = wall_result.point.x
-                    self.danger_sprite.y = wall_result.point.y
+    def activate(self):
+        self.score_label.visible = True
+        # Only as visible as danger_opacity says
+        self.danger_sprite.visible = True
+
+    def deactivate(self):
+        self.score_label.visible = False
+        self.danger_sprite.visible = False
 
     @property
     def score(self):
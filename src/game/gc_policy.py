@@ -0,0 +1,106 @@
+"""Control over when CPython's cyclic garbage collector runs.
+
+The game allocates a lot of short lived objects every tick (Vec2d's, colors, lists of objects to add and remove)
+which makes the garbage collector kick in at random points, often in the middle of a frame. Instead we
+freeze everything created at startup, turn off automatic collection while playing and only collect
+in the time left over at the end of a frame or between games."""
+import gc
+import time
+
+
+class GCPolicy:
+    """Decides when the garbage collector may run and reports how long it runs for to a Profiler."""
+
+    def __init__(self, profiler, frame_time, enabled=True):
+        self.profiler = profiler
+        # If False we leave the garbage collector alone and only report on it
+        self.enabled = enabled
+        # How long a single frame is allowed to take
+        self.frame_time = frame_time
+        # Whether we are in a game (and therefore collect manually)
+        self.in_gameplay = False
+        # How long the last collection of each generation took, used to guess if another one will fit
+        self.last_pause = [0.0, 0.0, 0.0]
+
+        # Whether the current collection was started by us
+        self._manual = False
+        self._pause_start = 0.0
+        self._frame_start = 0.0
+        self._tick_allocations = 0
+        gc.callbacks.append(self._on_gc)
+
+    def _on_gc(self, phase, info):
+        """Callback from the gc module, called at the start and stop of every collection (manual or automatic)."""
+        if phase == 'start':
+            self._pause_start = time.perf_counter()
+        else:
+            pause = time.perf_counter() - self._pause_start
+            generation = info['generation']
+            self.last_pause[generation] = pause
+            self.profiler.record('gc.pause', pause)
+            self.profiler.count(f'gc.collections.gen{generation}')
+            self.profiler.count('gc.collected', info['collected'])
+            if self.in_gameplay and not self._manual:
+                self.profiler.count('gc.automatic_in_gameplay')
+
+    def _collect(self, generation):
+        self._manual = True
+        try:
+            gc.collect(generation)
+        finally:
+            self._manual = False
+
+    def freeze(self):
+        """Move every object that exists right now (resources, fonts, window etc) out of the collector's reach.
+
+        Should be called once after startup. These objects live for the whole program, so there's no
+        point in having every full collection look at them again."""
+        if not self.enabled:
+            return
+        self._collect(2)
+        gc.freeze()
+
+    def enter_gameplay(self):
+        """Stop automatic collections, from now on we only collect in idle()."""
+        self.in_gameplay = True
+        if self.enabled:
+            gc.disable()
+
+    def leave_gameplay(self):
+        """Collect everything the game left behind and hand collection back to the interpreter.
+
+        Called between games, where a longer pause isn't noticeable."""
+        self.in_gameplay = False
+        if self.enabled:
+            self._collect(2)
+            gc.enable()
+
+    def begin_tick(self):
+        """Called at the start of every tick, which is also the start of the frame."""
+        self._frame_start = time.perf_counter()
+        self._tick_allocations = gc.get_count()[0]
+
+    def end_tick(self):
+        """Called at the end of every tick, records the net number of container objects allocated during the tick.
+
+        That's the number the garbage collector keeps track of to decide when to run."""
+        self.profiler.sample('alloc.objects', gc.get_count()[0] - self._tick_allocations)
+
+    def idle(self):
+        """Collect what we can in the time left of the current frame.
+
+        Collects the oldest generation that is over its threshold and whose last collection fit in the
+        remaining time. If we get too far behind (eg. because frames are always over budget) then collect anyway,
+        so memory doesn't grow without bounds."""
+        if not self.enabled or not self.in_gameplay:
+            return
+        remaining = self._frame_start + self.frame_time - time.perf_counter()
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        # Start with the oldest generation, since collecting it also collects the younger ones
+        for generation in (2, 1, 0):
+            if not thresholds[generation] or counts[generation] < thresholds[generation]:
+                continue
+            if self.last_pause[generation] < remaining or counts[generation] >= thresholds[generation] * 10:
+                self._collect(generation)
+                return
@@ -0,0 +1,93 @@
+"""Timestamped keyboard input, and measuring how long it takes for a key press to show up on screen."""
+import math
+import time
+
+
+class KeyInput:
+    """Event handler that queues key presses and releases (with the time they happened) until the next tick.
+
+    Unlike pyglet's KeyStateHandler, a key that is tapped between two ticks still counts as held down for the tick
+    that applies it, so short taps are never lost."""
+
+    def __init__(self):
+        # Keys held down after the last apply()
+        self.pressed = set()
+        # Keys held down after the last apply() and keys pressed since the apply() before that, what self[symbol]
+        # answers (a key released since then no longer counts, unless it was also pressed in between)
+        self.active = set()
+        # Events since the last apply() as (time, symbol, whether it's a press)
+        self._events = []
+
+    def on_key_press(self, symbol, modifiers):
+        self._events.append((time.perf_counter(), symbol, True))
+
+    def on_key_release(self, symbol, modifiers):
+        self._events.append((time.perf_counter(), symbol, False))
+
+    def apply(self):
+        """Applies the queued events, and returns the presses among them as (time, symbol)."""
+        presses = []
+        for timestamp, symbol, pressed in self._events:
+            if pressed:
+                self.pressed.add(symbol)
+                presses.append((timestamp, symbol))
+            else:
+                self.pressed.discard(symbol)
+        self._events.clear()
+        # Releases take effect right away, but a tap (pressed and released again since the last tick) still counts
+        self.active = self.pressed.union(symbol for _timestamp, symbol in presses)
+        return presses
+
+    def clear(self):
+        """Forgets about every key, held down or queued."""
+        self.pressed.clear()
+        self.active.clear()
+        self._events.clear()
+
+    def __getitem__(self, symbol):
+        return symbol in self.active
+
+
+class InputLatency:
+    """Measures the latency of key presses, from the event to the tick that applied it to the player's velocity
+    (input.apply), from there to the end of the next draw (input.draw), and the two together (input.total).
+
+    Timings go to the profiler, and every press is also counted in a histogram for the whole session."""
+    NAMES = ('input.apply', 'input.draw', 'input.total')
+    # Upper edges (in ms) of the histogram buckets
+    BUCKETS = (1, 2, 4, 8, 12, 16, 24, 33, 50, 100, math.inf)
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        # Presses that have been applied but not drawn yet, as (event time, applied time)
+        self._applied = []
+        self.histograms = {name: [0] * len(self.BUCKETS) for name in self.NAMES}
+
+    def applied(self, event_time):
+        """Called when a press has been applied to the game."""
+        self._applied.append((event_time, time.perf_counter()))
+
+    def drawn(self):
+        """Called when a frame has been drawn, completing every applied press."""
+        if not self._applied:
+            return
+        now = time.perf_counter()
+        for event_time, applied_time in self._applied:
+            for name, seconds in zip(self.NAMES, (applied_time - event_time, now - applied_time, now - event_time)):
+                self.profiler.record(name, seconds)
+                histogram = self.histograms[name]
+                ms = seconds * 1000
+                histogram[next(i for i, edge in enumerate(self.BUCKETS) if ms <= edge)] += 1
+        self._applied.clear()
+
+    def report(self):
+        """The histograms as text, one row per bucket."""
+        presses = sum(self.histograms['input.total'])
+        lines = [f'Input latency of {presses} key presses (ms):',
+                 f'{"":>10}' + ''.join(f'{name:>14}' for name in self.NAMES)]
+        lower = 0
+        for i, edge in enumerate(self.BUCKETS):
+            bucket = f'{lower}-{edge}' if edge != math.inf else f'>{lower}'
+            lines.append(f'{bucket:>10}' + ''.join(f'{self.histograms[name][i]:>14}' for name in self.NAMES))
+            lower = edge
+        return '\n'.join(lines)
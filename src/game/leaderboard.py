@@ -0,0 +1,140 @@
+import bisect
+
+from pyglet.text import Label
+
+
+class Leaderboard:
+    """Every highscore ever, from best to worst.
+
+    Highscores are anything with a score attribute. They're kept sorted as they are added, so looking at any range of
+    ranks is instant and finding the rank of a score is a binary search (with bisect). Adding still has to make room
+    in the lists, which takes time in proportion to how many there are, but that's only once per game."""
+
+    def __init__(self, highscores=()):
+        self.highscores = sorted(highscores, key=lambda highscore: highscore.score, reverse=True)
+        # The scores negated, so they're in the ascending order that bisect works with
+        self._keys = [-highscore.score for highscore in self.highscores]
+
+    def __len__(self):
+        return len(self.highscores)
+
+    def __iter__(self):
+        return iter(self.highscores)
+
+    def __getitem__(self, index):
+        return self.highscores[index]
+
+    def add(self, highscore) -> int:
+        """Adds highscore below any equal scores, and returns its rank (0 is the best)."""
+        rank = self.rank_of(highscore.score)
+        self._keys.insert(rank, -highscore.score)
+        self.highscores.insert(rank, highscore)
+        return rank
+
+    def rank_of(self, score) -> int:
+        """The rank a highscore with score would get if it was added now (0 is the best)."""
+        return bisect.bisect_right(self._keys, -score)
+
+
+class LeaderboardView:
+    """Shows a few ranks of a Leaderboard at a time.
+
+    There is a fixed pool of labels, one per row, and only those get their text updated when scrolling. So
+    creating and scrolling the view takes the same time no matter how long the leaderboard is."""
+    # Color of the row with the rank to highlight (eg. the score that was just added) and every other row
+    HIGHLIGHT_COLOR = (255, 255, 0, 255)
+    COLOR = (255, 255, 255, 255)
+
+    def __init__(self, *, x, top, rows, row_height, font_size, batch):
+        self.leaderboard = Leaderboard()
+        # Rank shown in the first row
+        self.offset = 0
+        # Rank to highlight, if any
+        self.highlight = None
+        self._visible = True
+
+        self.labels = [Label(
+            '',
+            font_name='m5x7',
+            font_size=font_size,
+            x=x,
+            y=top - i * row_height,
+            align='center',
+            anchor_x='center',
+            anchor_y='bottom',
+            batch=batch
+        ) for i in range(rows)]
+
+    @property
+    def rows(self):
+        return len(self.labels)
+
+    def show(self, leaderboard: Leaderboard, highlight=None):
+        """Shows leaderboard, starting from the top or around the rank to highlight."""
+        self.leaderboard = leaderboard
+        self.highlight = highlight
+        if highlight is None:
+            self.scroll_to(0)
+        else:
+            self.jump_to(highlight)
+
+    def scroll_to(self, rank):
+        """Shows rank in the first row (or as close as possible while still filling every row)."""
+        self.offset = max(0, min(rank, len(self.leaderboard) - self.rows))
+        self._layout()
+
+    def scroll(self, rows):
+        """Scrolls down (or up if negative) by a number of rows."""
+        self.scroll_to(self.offset + rows)
+
+    def page(self, pages):
+        """Scrolls down (or up if negative) by a number of pages."""
+        self.scroll(pages * self.rows)
+
+    def jump_to(self, rank):
+        """Shows rank in the middle row."""
+        self.scroll_to(rank - self.rows // 2)
+
+    @property
+    def first(self):
+        """Rank shown in the first row."""
+        return self.offset
+
+    @property
+    def last(self):
+        """Rank shown in the last row that's filled."""
+        return min(self.offset + self.rows, len(self.leaderboard)) - 1
+
+    def _layout(self):
+        # Only the rows whose text or color actually changed are laid out again
+        for rank, label in enumerate(self.labels, self.offset):
+            if rank < len(self.leaderboard):
+                highscore = self.leaderboard[rank]
+                text = f'{rank + 1}. {highscore.name} - {highscore.score}'
+            else:
+                text = ''
+            if label.text != text:
+                label.text = text
+            color = self.HIGHLIGHT_COLOR if rank == self.highlight else self.COLOR
+            if tuple(label.color) != color:
+                label.color = color
+        self._update_visibility()
+
+    @property
+    def visible(self):
+        return self._visible
+
+    @visible.setter
+    def visible(self, visible):
+        self._visible = visible
+        self._update_visibility()
+
+    def _update_visibility(self):
+        for label in self.labels:
+            visible = self._visible and bool(label.text)
+            if label.visible != visible:
+                label.visible = visible
+
+    def delete(self):
+        for label in self.labels:
+            label.delete()
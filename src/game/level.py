@@ -1,20 +1,11 @@
 import random
-from collections import namedtuple
+import time
 
 import pymunk
 from pyglet.graphics import OrderedGroup
 
-from . import GameObject, EnemyPawn, WIDTH, HEIGHT, EnemySlider, Pellet
-
-# Type to score data about enemies
-# Weight is how likely they are to spawn
-# Cap is how many can exist at once at the most
-EnemyData = namedtuple('EnemyData', 'type, weight, cap')
-
-enemy_data = [
-    EnemyData(EnemyPawn, 100, 100),
-    EnemyData(EnemySlider, 20, 2),
-]
+from . import GameObject, WIDTH, HEIGHT, Pellet, profiler
+from .waves import WAVES, Waves
 
 
 def clamp(value, lower, upper):
@@ -23,91 +14,130 @@ def clamp(value, lower, upper):
 
 
 class Level(GameObject):
-    """Level that handles spawning of pellets and enemies."""
+    """Level that handles spawning of pellets and enemies.
+
+    Enemies are spawned by the waves (see waves.py). When a wave is due its enemies are queued up, and every tick
+    enemies are taken off the queue and built until SPAWN_BUDGET is used up. So a big wave is spread over a few ticks
+    instead of making a single tick take too long."""
+    # Seconds of each tick that may be spent building enemies (at least one is always built)
+    SPAWN_BUDGET = 0.002
 
-    def __init__(self, *, batch, player):
+    def __init__(self, *, batch, player, spatial, projectiles, particles, waves: Waves = WAVES):
         super().__init__()
         self.batch = batch
         self.player = player
+        self.spatial = spatial
+        self.projectiles = projectiles
+        self.particles = particles
+        self.waves = waves
 
-        self.enemy_timer = 2
+        # Ticks since the level started, which is where we are in the waves
+        self.ticks = 0
+        # Enemies waiting to be spawned of each wave
+        self.pending = [0] * len(waves)
 
         self.enemy_group = OrderedGroup(0)
         self.pellet_group = OrderedGroup(1)
 
         # Keep track of how many enemies of each type we've spawned
         # so we can keep it under its cap
-        self.spawned_enemies = {enemy.type: 0 for enemy in enemy_data}
+        self.spawned_enemies = {enemy_type: 0 for enemy_type in waves.types}
 
         # Spawn the first pellet
         # Additional pellets are spawned in the pellet collision callback
         self.spawn_pellet()
 
     def tick(self, dt: float):
-        self.enemy_timer += dt
-
-        # If it's time to spawn an enemy
-        if self.enemy_timer >= 2:
-            # Choose a random enemy taking weight and max cap into account
-            enemies = [(enemy.type, enemy.weight) for enemy in enemy_data if
-                       self.spawned_enemies[enemy.type] < enemy.cap]
-            # If we have no more enemies to spawn (all have reached their cap) then abort
-            if len(enemies) < 1:
-                return
-            # Get types and weights as two separate lists
-            types, weights = zip(*enemies)
-            # Choose a type based on the weights
-            enemy_type = random.choices(types, weights)[0]
-            # We've now spawned another one of this type
-            self.spawned_enemies[enemy_type] += 1
-            # Get the size of the enemy
-            # But divide by 2, cause we only need it to determine how far from wall to spawn the enemy
-            size_x, size_y = enemy_type.SIZE / 2
-
-            # If player is in the middle
-            middle_bb = pymunk.BB.newForCircle((WIDTH / 2, HEIGHT / 2), 50)
-            if middle_bb.contains_vect(self.player.pos):
-                # Pick a random place to spawn the enemy
-                # Pick left, top, right, bottom side and pick a random position on that wall
-                side = random.choice([0, 1, 2, 3])
-                if side == 0:
-                    pos = (size_x, random.randrange(size_y, HEIGHT - size_y))
-                elif side == 1:
-                    pos = (random.randrange(size_x, WIDTH - size_x), HEIGHT - size_y)
-                elif side == 2:
-                    pos = (WIDTH - size_x, random.randrange(size_y, HEIGHT - size_y))
-                else:
-                    pos = (random.randrange(size_x, WIDTH - size_x), size_y)
+        for index in self.waves.due(self.ticks):
+            self.pending[index] += self.waves[index].amount
+        self.ticks += 1
+        if any(self.pending):
+            self._spawn_pending()
+        profiler.sample('level.pending', sum(self.pending))
+
+    def _spawn_pending(self):
+        """Spawns the queued enemies of every wave until the budget of this tick is used up."""
+        deadline = time.perf_counter() + self.SPAWN_BUDGET
+        for index, wave in enumerate(self.waves):
+            while self.pending[index]:
+                # Choose a random enemy taking weight and max cap into account
+                enemy_type = self.waves.choose(wave, self.spawned_enemies)
+                # If we have no more enemies to spawn (all have reached their cap) then forget about the rest
+                if enemy_type is None:
+                    self.pending[index] = 0
+                    break
+                pos = self._spawn_position(enemy_type)
+                # If there's no room anywhere then try again next tick
+                if pos is None:
+                    return
+
+                # We've now spawned another one of this type
+                self.pending[index] -= 1
+                self.spawned_enemies[enemy_type] += 1
+                # Spawn an enemy at the found position
+                with profiler.trace(f'spawn {enemy_type.__name__}'):
+                    enemy = enemy_type(pos=pos, player=self.player, spatial=self.spatial,
+                                       projectiles=self.projectiles, particles=self.particles, batch=self.batch,
+                                       group=self.enemy_group)
+                # It's only added to the game after the tick, but the next enemy shouldn't spawn on top of it
+                self.spatial.track(enemy)
+                self.spawn(enemy)
+                profiler.count('level.spawned')
+
+                if time.perf_counter() >= deadline:
+                    # The rest will have to wait until the next tick
+                    return
+
+    def _spawn_position(self, enemy_type):
+        """Somewhere for enemy_type to spawn far away from the player (None if there's no room anywhere)."""
+        # Get the size of the enemy
+        # But divide by 2, cause we only need it to determine how far from wall to spawn the enemy
+        size_x, size_y = enemy_type.SIZE / 2
+
+        # If player is in the middle
+        middle_bb = pymunk.BB.newForCircle((WIDTH / 2, HEIGHT / 2), 50)
+        if middle_bb.contains_vect(self.player.pos):
+            # Pick a random place to spawn the enemy
+            # Pick left, top, right, bottom side and pick a random position on that wall
+            side = random.choice([0, 1, 2, 3])
+            if side == 0:
+                pos = (size_x, random.randrange(size_y, HEIGHT - size_y))
+            elif side == 1:
+                pos = (random.randrange(size_x, WIDTH - size_x), HEIGHT - size_y)
+            elif side == 2:
+                pos = (WIDTH - size_x, random.randrange(size_y, HEIGHT - size_y))
             else:
-                # Otherwise, then find a position that is far away from the player
-                # The below code is very math heavy but effectively finds a position that is on a inner
-                # rectangle as close to the walls as possible (that the enemy can fit), but
-                # also as far away from the player as possible
-                x, y = self.player.pos
-                # Mirror players's x and y over the enter axis point and then clamp
-                # it as close to the wall as possible for this enemy
-                x = WIDTH / 2 - (x - WIDTH / 2)
-                x = clamp(x, size_x, WIDTH - size_x)
-                y = HEIGHT / 2 - (y - HEIGHT / 2)
-                y = clamp(y, size_y, HEIGHT - size_y)
-                # Find distances to walls
-                x_wall_dir = abs(min(x, WIDTH - x))
-                y_wall_dir = abs(min(y, HEIGHT - y))
-                # If the x wall is closer then clamp it close to that one
-                if x_wall_dir < y_wall_dir:
-                    x = size_x if x < WIDTH / 2 else WIDTH - size_x
-                else:
-                    y = size_y if y < HEIGHT / 2 else HEIGHT - size_y
-                # Then save that position
-                pos = (x, y)
-
-            # Spawn an enemy at the found position
-            self.new_objects += [enemy_type(pos=pos, player=self.player, batch=self.batch, group=self.enemy_group)]
-            self.enemy_timer = 0
+                pos = (random.randrange(size_x, WIDTH - size_x), size_y)
+        else:
+            # Otherwise, then find a position that is far away from the player
+            # The below code is very math heavy but effectively finds a position that is on a inner
+            # rectangle as close to the walls as possible (that the enemy can fit), but
+            # also as far away from the player as possible
+            x, y = self.player.pos
+            # Mirror players's x and y over the enter axis point and then clamp
+            # it as close to the wall as possible for this enemy
+            x = WIDTH / 2 - (x - WIDTH / 2)
+            x = clamp(x, size_x, WIDTH - size_x)
+            y = HEIGHT / 2 - (y - HEIGHT / 2)
+            y = clamp(y, size_y, HEIGHT - size_y)
+            # Find distances to walls
+            x_wall_dir = abs(min(x, WIDTH - x))
+            y_wall_dir = abs(min(y, HEIGHT - y))
+            # If the x wall is closer then clamp it close to that one
+            if x_wall_dir < y_wall_dir:
+                x = size_x if x < WIDTH / 2 else WIDTH - size_x
+            else:
+                y = size_y if y < HEIGHT / 2 else HEIGHT - size_y
+            # Then save that position
+            pos = (x, y)
+
+        # Make sure we don't spawn on top of another enemy, move somewhere close by if we would
+        return self.spatial.nearest_free_spawn(pos, enemy_type.SIZE)
 
     def spawn_pellet(self):
         # Find a random place at least 100px away from the walls
         x = random.randrange(175, WIDTH - 175)
         y = random.randrange(175, HEIGHT - 175)
         # And then spawn a pellet there
-        self.new_objects += [Pellet(pos=(x, y), batch=self.batch, group=self.pellet_group)]
+        with profiler.trace('spawn Pellet'):
+            self.spawn(Pellet(pos=(x, y), batch=self.batch, group=self.pellet_group))
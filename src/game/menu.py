@@ -5,166 +5,221 @@ from pyglet.text.layout import IncrementalTextLayout
 from pyglet.text.document import UnformattedDocument
 import pytweening
 
-from . import GameObject, WIDTH, HEIGHT, blink
+from . import GameObject, WIDTH, HEIGHT, blink, Leaderboard, LeaderboardView
 
 
 class Menu(GameObject):
     """Provides menus for the game. Both main menu with highscores and a menu to input name for highscore.
 
-    Which menu is shown depends on add_score. If it's None then main menu is shown."""
-    def __init__(self, *, highscores, ui_batch, cb_start_game=None, cb_add_highscore=None, add_score=None):
+    The labels for both menus are created once and kept around. Which menu is shown depends on the add_score
+    given to show(). If it's None then main menu is shown."""
+    # How many highscores the main menu has room for at once, the rest can be scrolled to
+    LEADERBOARD_ROWS = 9
+
+    def __init__(self, *, ui_batch, cb_start_game, cb_add_highscore):
         super().__init__()
 
         # Make sure we can handle events
         self.event_handlers = [self]
 
-        # Store callbacks, the ui batch and our optional score3
+        # Store callbacks and the ui batch
         self.cb_start_game = cb_start_game
         self.cb_add_highscore = cb_add_highscore
         self.ui_batch = ui_batch
-        self.add_score = add_score
-
-        # We need to keep track of our children so we can remove them in self.delete()
-        self.children = []
+        # Set in self.show()
+        self.add_score = None
+        self.leaderboard = Leaderboard()
+        # Whether the menu is currently shown at all
+        self.active = True
 
         # Show title
-        self.children.append(Label(
-            'WELCOME TO',
+        self.title_labels = [
+            Label(
+                'WELCOME TO',
+                font_name='m5x7',
+                font_size=128,
+                x=WIDTH / 2,
+                y=HEIGHT - 16,
+                anchor_x='center',
+                anchor_y='top',
+                batch=self.ui_batch
+            ),
+            Label(
+                'HELL',
+                font_name='m5x7',
+                font_size=512,
+                x=WIDTH / 2 + 50,
+                y=HEIGHT,
+                anchor_x='center',
+                anchor_y='top',
+                batch=self.ui_batch
+            )
+        ]
+
+        # Main menu
+        # Title for the highscores
+        self.highscores_label = Label(
+            'Highscores:',
+            font_name='m5x7',
+            font_size=48,
+            x=WIDTH / 2,
+            y=420,
+            align='center',
+            anchor_x='center',
+            anchor_y='bottom',
+            batch=self.ui_batch
+        )
+        # ... followed by a row for each highscore that fits, the leaderboard is shown in self.show()
+        self.leaderboard_view = LeaderboardView(x=WIDTH / 2, top=380, rows=self.LEADERBOARD_ROWS, row_height=32,
+                                                font_size=32, batch=self.ui_batch)
+        # Continue label, it's moved below the highscores (if any) in self.show()
+        self.continue_label = Label(
+            'Press SPACE to start game...',
+            font_name='m5x7',
+            font_size=48,
+            x=WIDTH / 2,
+            y=HEIGHT / 4,
+            align='center',
+            anchor_x='center',
+            anchor_y='bottom',
+            batch=self.ui_batch
+        )
+        # Timer for blinking
+        self.continue_timer = 0
+
+        # Menu for adding a score
+        # Show some text
+        self.score_title_label = Label(
+            'Your score was:',
+            font_name='m5x7',
+            font_size=48,
+            x=WIDTH / 2,
+            y=400,
+            align='center',
+            anchor_x='center',
+            anchor_y='bottom',
+            batch=self.ui_batch
+        )
+        self.score_label = Label(
+            '',
             font_name='m5x7',
             font_size=128,
             x=WIDTH / 2,
-            y=HEIGHT - 16,
+            y=280,
+            align='center',
             anchor_x='center',
-            anchor_y='top',
+            anchor_y='bottom',
             batch=self.ui_batch
-        ))
-        self.children.append(Label(
-            'HELL',
+        )
+        self.name_label = Label(
+            'Enter name for highscore:',
             font_name='m5x7',
-            font_size=512,
-            x=WIDTH / 2 + 50,
-            y=HEIGHT,
+            font_size=32,
+            x=WIDTH / 2,
+            y=200,
+            align='center',
             anchor_x='center',
-            anchor_y='top',
+            anchor_y='bottom',
             batch=self.ui_batch
-        ))
+        )
 
-        # If we need to add a score
-        if add_score is not None:
-            # Make sure that self.continue_label exists so we don't crash in self.tick()
-            self.continue_label = None
+        # Prepare a document with styling
+        self.document = UnformattedDocument()
+        self.document.set_style(0, 1, {
+            'font_name': 'm5x7',
+            'font_size': 64,
+            'color': (255, 255, 255, 255),
+            'align': 'center'
+        })
+        # Find the height of the font
+        font = self.document.get_font()
+        height = font.ascent - font.descent
+        # Make a TextLayout that handles dynamically adding text
+        # Make it multiline even though we don't want multiple lines because otherwise align=center doesn't work
+        # Coordinates need to be ints, since the layout passes them straight on to glScissor
+        self.layout = IncrementalTextLayout(self.document, WIDTH // 3, height, multiline=True, batch=self.ui_batch)
+        self.layout.anchor_y = 'top'
+        self.layout.anchor_x = 'center'
+        self.layout.x = WIDTH // 2
+        self.layout.y = 200
+        # Add a carat (cursor)
+        self.caret = Caret(self.layout, batch=self.ui_batch, color=(255, 255, 255))
 
-            # Show some text
-            self.children.append(Label(
-                'Your score was:',
-                font_name='m5x7',
-                font_size=48,
-                x=WIDTH / 2,
-                y=400,
-                align='center',
-                anchor_x='center',
-                anchor_y='bottom',
-                batch=self.ui_batch
-            ))
-            self.children.append(Label(
-                f'{add_score}',
-                font_name='m5x7',
-                font_size=128,
-                x=WIDTH / 2,
-                y=280,
-                align='center',
-                anchor_x='center',
-                anchor_y='bottom',
-                batch=self.ui_batch
-            ))
-            self.children.append(Label(
-                'Enter name for highscore:',
-                font_name='m5x7',
-                font_size=32,
-                x=WIDTH / 2,
-                y=200,
-                align='center',
-                anchor_x='center',
-                anchor_y='bottom',
-                batch=self.ui_batch
-            ))
-
-            # Prepare a document with styling
-            self.document = UnformattedDocument()
-            self.document.set_style(0, 1, {
-                'font_name': 'm5x7',
-                'font_size': 64,
-                'color': (255, 255, 255, 255),
-                'align': 'center'
-            })
-            # Find the height of the font
-            font = self.document.get_font()
-            height = font.ascent - font.descent
-            # Make a TextLayout that handles dynamically adding text
-            # Make it multiline even though we don't want multiple lines because otherwise align=center doesn't work
-            self.layout = IncrementalTextLayout(self.document, WIDTH / 3, height, multiline=True, batch=self.ui_batch)
-            self.layout.anchor_y = 'top'
-            self.layout.anchor_x = 'center'
-            self.layout.x = WIDTH / 2
-            self.layout.y = 200
-            # Add a carat (cursor)
-            self.caret = Caret(self.layout, batch=self.ui_batch, color=(255, 255, 255))
+        # We need to keep track of our children so we can remove them in self.delete()
+        self.children = [*self.title_labels, self.highscores_label, self.leaderboard_view, self.continue_label,
+                         self.score_title_label, self.score_label, self.name_label, self.layout, self.caret]
+
+    def show(self, *, leaderboard: Leaderboard, add_score=None, own_rank=None):
+        """Switch to the main menu or, if add_score is not None, to the menu to input name for a highscore.
+
+        The main menu shows the leaderboard around own_rank (highlighted) if given, otherwise from the top.
+        Only labels whose text actually changed are laid out again."""
+        self.add_score = add_score
+        self.leaderboard = leaderboard
+
+        # Clear the name from last time
+        # The layout can't be hidden without losing its document, but it doesn't show anything while empty
+        self.document.text = ''
+
+        if add_score is not None:
+            self.score_label.text = f'{add_score}'
+            # Let them know where on the leaderboard they're about to end up
+            self.name_label.text = (f'Enter name for highscore #{leaderboard.rank_of(add_score) + 1} '
+                                    f'of {len(leaderboard) + 1}:')
             # Type q and then backspace
             # This ensures that the carat is visible as it only shows up after something has been typed
             self.caret.on_text('q')
             self.caret.on_text_motion(key.MOTION_BACKSPACE)
-            # Make sure we can delete layout and carat in self.delete()
-            self.children.append(self.layout)
-            self.children.append(self.caret)
         else:
-            # If we have some highscores to show
-            if highscores:
-                # Show a title
-                self.children.append(Label(
-                    'Highscores:',
-                    font_name='m5x7',
-                    font_size=48,
-                    x=WIDTH / 2,
-                    y=420,
-                    align='center',
-                    anchor_x='center',
-                    anchor_y='bottom',
-                    batch=self.ui_batch
-                ))
-                # ... followed by each highscore
-                for i, highscore in enumerate(highscores):
-                    self.children.append(Label(
-                        f'{highscore.name} - {highscore.score}',
-                        font_name='m5x7',
-                        font_size=32,
-                        x=WIDTH / 2,
-                        y=380 - i * 32,
-                        align='center',
-                        anchor_x='center',
-                        anchor_y='bottom',
-                        batch=self.ui_batch
-                    ))
-
-            # Show continue label, and make sure to have it below highscores if any
-            self.continue_label = Label(
-                'Press SPACE to start game...',
-                font_name='m5x7',
-                font_size=48,
-                x=WIDTH / 2,
-                y=32 if highscores else HEIGHT / 4,
-                align='center',
-                anchor_x='center',
-                anchor_y='bottom',
-                batch=self.ui_batch
-            )
-            # Timer for blinking
+            self.leaderboard_view.show(leaderboard, highlight=own_rank)
+            self._update_highscores_label()
+            # Make sure to have the continue label below highscores if any
+            self.continue_label.y = 32 if len(leaderboard) else HEIGHT / 4
             self.continue_timer = 0
 
-            self.children.append(self.continue_label)
+        self._update_visibility()
+
+    def _update_highscores_label(self):
+        """Show which ranks are shown, if there are more than fit at once."""
+        view = self.leaderboard_view
+        text = 'Highscores:'
+        if len(self.leaderboard) > view.rows:
+            text = f'Highscores ({view.first + 1}-{view.last + 1} of {len(self.leaderboard)}):'
+        if self.highscores_label.text != text:
+            self.highscores_label.text = text
+
+    def activate(self):
+        self.active = True
+        self._update_visibility()
+
+    def deactivate(self):
+        self.active = False
+        self._update_visibility()
+
+    def _update_visibility(self):
+        """Show the labels that belong to the current menu and hide the rest."""
+        main_menu = self.active and self.add_score is None
+        score_menu = self.active and self.add_score is not None
+
+        for label in self.title_labels:
+            label.visible = self.active
+
+        self.highscores_label.visible = main_menu and bool(len(self.leaderboard))
+        self.leaderboard_view.visible = main_menu
+        self.continue_label.visible = main_menu
+
+        for label in (self.score_title_label, self.score_label, self.name_label):
+            label.visible = score_menu
+        self.caret.visible = score_menu
+
+    @property
+    def animating(self):
+        # Only the main menu blinks (the caret of the highscore menu blinks by itself)
+        return self.active and self.add_score is None
 
     def tick(self, dt: float):
-        # If we have a continue label then blink it
-        if self.continue_label:
+        # If we're showing the main menu then blink the continue label
+        if self.add_score is None:
             self.continue_timer += dt
             if self.continue_timer > 2:
                 self.continue_timer = 0
@@ -172,6 +227,8 @@ class Menu(GameObject):
                                               (255, 255, 255))
 
     def delete(self):
+        # Hiding the caret stops its blink schedule, which would otherwise keep it alive
+        self.caret.visible = False
         # Make sure to also delete our children
         for child in self.children:
             child.delete()
@@ -182,6 +239,10 @@ class Menu(GameObject):
             # If we are not adding a score then if space was pressed, start the game
             if symbol == key.SPACE:
                 self.cb_start_game()
+            # Tab jumps back to the score that was just added
+            elif symbol == key.TAB and self.leaderboard_view.highlight is not None:
+                self.leaderboard_view.jump_to(self.leaderboard_view.highlight)
+                self._update_highscores_label()
         else:
             # If we are adding a score then when enter is pressed, submit
             # that highscore (which will then also go to next menu screen)
@@ -203,3 +264,19 @@ class Menu(GameObject):
         if self.add_score is not None:
             # Forward text motions to the caret
             self.caret.on_text_motion(motion, select)
+        else:
+            # Scroll through the leaderboard with the arrow keys, page up/down and home/end
+            view = self.leaderboard_view
+            if motion == key.MOTION_UP:
+                view.scroll(-1)
+            elif motion == key.MOTION_DOWN:
+                view.scroll(1)
+            elif motion == key.MOTION_PREVIOUS_PAGE:
+                view.page(-1)
+            elif motion == key.MOTION_NEXT_PAGE:
+                view.page(1)
+            elif motion == key.MOTION_BEGINNING_OF_LINE:
+                view.scroll_to(0)
+            elif motion == key.MOTION_END_OF_LINE:
+                view.scroll_to(len(self.leaderboard))
+            self._update_highscores_label()
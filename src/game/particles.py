@@ -0,0 +1,146 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+from pyglet import gl
+from pyglet.graphics import Group
+
+from . import GameObject, profiler
+
+# How a burst of particles looks, each range is (min, max) and picked at random for every particle
+# speed is in pixels per second, lifetime in seconds and size is half the width of a particle in pixels
+Emitter = namedtuple('Emitter', 'amount, color, speed, lifetime, size, spread')
+
+# Sparks flying in every direction when the player picks up a pellet
+PELLET_PICKUP = Emitter(amount=24, color=(255, 255, 255), speed=(60, 300), lifetime=(0.2, 0.6), size=(1.5, 3),
+                        spread=math.tau)
+# Debris thrown back from the front of a slider when it's done moving (tinted with the slider's color)
+SLIDER_SLAM = Emitter(amount=64, color=(255, 255, 255), speed=(100, 500), lifetime=(0.3, 0.9), size=(2, 5),
+                      spread=math.pi)
+
+
+class _AdditiveGroup(Group):
+    """Blends what's drawn in it additively, so overlapping particles glow and faded ones disappear."""
+
+    def set_state(self):
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE)
+
+    def unset_state(self):
+        gl.glDisable(gl.GL_BLEND)
+
+
+class ParticleSystem(GameObject):
+    """Short lived particles for effects, like picking up a pellet or a slider slamming into something.
+
+    Works like ProjectileStore: particles are a struct of NumPy arrays that are aged, moved and faded with a handful
+    of array operations per tick and drawn from a single vertex list, so there are no python objects per particle.
+    Live particles are always kept at the start of the arrays.
+
+    Particles are only for show, so they use a random generator of their own and never touch the random module
+    (which is part of rewind snapshots)."""
+    # Particles lose this fraction of their speed every second
+    DRAG = 0.95
+    # Corners of a particle's quad relative to its position, scaled by its size
+    CORNERS = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], np.float32)
+
+    def __init__(self, *, batch, group=None, capacity=32768):
+        super().__init__()
+        self.capacity = capacity
+        self.rng = np.random.default_rng()
+
+        self.positions = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocities = np.zeros((capacity, 2), dtype=np.float32)
+        self.ages = np.zeros(capacity, dtype=np.float32)
+        self.lifetimes = np.ones(capacity, dtype=np.float32)
+        self.sizes = np.zeros(capacity, dtype=np.float32)
+        self.colors = np.zeros((capacity, 3), dtype=np.uint8)
+        self.count = 0
+
+        # One quad for every particle we could ever have, unused ones are collapsed to a single point
+        self.vertex_list = batch.add(capacity * 4, gl.GL_QUADS, _AdditiveGroup(parent=group), 'v2f/stream',
+                                     'c4B/stream')
+        # How many quads currently have vertices, so we know which ones to collapse
+        self._drawn = 0
+        self.visible = True
+
+    def burst(self, emitter: Emitter, pos, angle=0.0, color=None):
+        """Spawns a burst of particles at pos, spread around angle (in radians).
+
+        color overrides the color of the emitter. Particles that don't fit are dropped."""
+        amount = min(emitter.amount, self.capacity - self.count)
+        if amount < emitter.amount:
+            profiler.count('particles.dropped', emitter.amount - amount)
+        if amount == 0:
+            return
+        rng = self.rng
+        new = slice(self.count, self.count + amount)
+        angles = angle + rng.uniform(-emitter.spread / 2, emitter.spread / 2, amount)
+        speeds = rng.uniform(*emitter.speed, amount)
+        self.positions[new] = pos
+        self.velocities[new, 0] = np.cos(angles) * speeds
+        self.velocities[new, 1] = np.sin(angles) * speeds
+        self.ages[new] = 0
+        self.lifetimes[new] = rng.uniform(*emitter.lifetime, amount)
+        self.sizes[new] = rng.uniform(*emitter.size, amount)
+        self.colors[new] = color or emitter.color
+        self.count += amount
+
+    def clear(self):
+        """Removes every particle."""
+        self.count = 0
+        self._update_vertices()
+
+    def tick(self, dt: float):
+        with profiler.measure('particles.update'):
+            self._update(dt)
+        with profiler.measure('particles.vertices'):
+            self._update_vertices()
+        profiler.sample('particles.live', self.count)
+
+    def _update(self, dt):
+        count = self.count
+        if not count:
+            return
+        ages = self.ages[:count]
+        ages += dt
+        alive = ages < self.lifetimes[:count]
+        if not alive.all():
+            # Move the survivors to the start of the arrays
+            keep = np.flatnonzero(alive)
+            count = self.count = len(keep)
+            for array in (self.positions, self.velocities, self.ages, self.lifetimes, self.sizes, self.colors):
+                array[:count] = array[keep]
+        velocities = self.velocities[:count]
+        velocities *= (1 - self.DRAG) ** dt
+        self.positions[:count] += velocities * dt
+
+    def _update_vertices(self):
+        """Moves, shrinks and fades the quads of the live particles, and collapses the ones that aren't used."""
+        drawn = self.count if self.visible else 0
+        if drawn == 0 and self._drawn == 0:
+            return
+        vertices = np.ctypeslib.as_array(self.vertex_list.vertices).reshape(-1, 4, 2)
+        if drawn:
+            # Particles shrink and fade out over their lifetime
+            remaining = 1 - self.ages[:drawn] / self.lifetimes[:drawn]
+            sizes = self.sizes[:drawn] * remaining
+            vertices[:drawn] = self.positions[:drawn, np.newaxis, :] + self.CORNERS * sizes[:, np.newaxis, np.newaxis]
+            colors = np.ctypeslib.as_array(self.vertex_list.colors).reshape(-1, 4, 4)
+            colors[:drawn, :, :3] = self.colors[:drawn, np.newaxis, :]
+            colors[:drawn, :, 3] = (remaining * 255).astype(np.uint8)[:, np.newaxis]
+        if drawn < self._drawn:
+            vertices[drawn:self._drawn] = 0
+        self._drawn = drawn
+
+    def activate(self):
+        self.visible = True
+        self._update_vertices()
+
+    def deactivate(self):
+        self.visible = False
+        self._update_vertices()
+
+    def delete(self):
+        self.vertex_list.delete()
+        super().delete()
@@ -1,31 +1,26 @@
-from pymunk.vec2d import Vec2d
 import pymunk
 
-from . import Actor, resources, CollisionType
+from . import Actor, resources, CollisionType, profiler, PELLET_PICKUP, animator, spin, analytics
 
 
 class Pellet(Actor):
     """A "Pellet" that the player can pick up to increase their score."""
+    __slots__ = ()
+    heatmap = 'pellets'
 
     def __init__(self, *, pos, batch=None, **kwargs):
         # Make a body and shape for the pellet
         # While the pellet can't move, we still need a shape (and therefore a body) to do proper collision handling
+        # The body is kinematic, so the solver never tries to move it. Sliders push it by hand instead
         size = (16, 16)
-        mass = 50
-        body = pymunk.Body(mass, pymunk.moment_for_box(mass, size))
+        body = pymunk.Body(body_type=pymunk.Body.KINEMATIC)
         shape = pymunk.Poly.create_box(body, size, 0)
         shape.collision_type = CollisionType.Pellet
         shape.filter = pymunk.ShapeFilter(categories=CollisionType.Pellet,
                                           mask=pymunk.ShapeFilter.ALL_MASKS ^ CollisionType.EnemyPawn)
         super().__init__(body=body, shape=shape, img=resources.pellet_image, batch=batch, pos=pos, **kwargs)
-
-    def tick(self, dt: float):
-        super().tick(dt)
-        # Rotate a bit
-        self.rotation += 90 * dt
-
-        # Don't ever glide or move (unless pushed)
-        self.body.velocity = Vec2d()
+        # Rotate a bit all the time
+        animator.play(self, 'rotation', spin(90))
 
     def on_player_collide(self, game_window):
         """Gets called when a player collides with a pellet."""
@@ -34,6 +29,8 @@ class Pellet(Actor):
             # When we die then make a new pellet and add 1 to score
             game_window.level.spawn_pellet()
             game_window.ui.score += 1
+            game_window.particles.burst(PELLET_PICKUP, self.pos)
+            analytics.event('pickup', self.pos, score=game_window.ui.score)
             self.die()
 
     @staticmethod
@@ -42,7 +39,8 @@ class Pellet(Actor):
 
         def pre_solve(arbiter, _space, _data):
             """Ignore default collision, and instead call the on_player_collide"""
-            arbiter.shapes[1].owner.on_player_collide(game_window)
+            with profiler.trace('collision Player/Pellet'):
+                arbiter.shapes[1].owner.on_player_collide(game_window)
             return False
 
         # Call proper on_player_collide (this is a staticmethod, so we need to do shape.owner
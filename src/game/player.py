@@ -1,16 +1,14 @@
 import string
 import random
 import math
-from functools import partial
-from collections import defaultdict
 
 from pymunk.vec2d import Vec2d
 from pyglet.window import key as pyglet_key
-from pyglet.text import Label
+from pyglet.sprite import Sprite
 import pymunk
 import pytweening
 
-from . import Actor, resources, CollisionType, blink
+from . import Actor, resources, CollisionType, blink, animator, KeyInput, analytics
 
 
 class Player(Actor):
@@ -29,21 +27,28 @@ class Player(Actor):
         KEY_RIGHT: (1, 0)
     }
 
-    # Offsets of where to show the labels for which key to press
+    # Offsets of where to show the sprites for which key to press
     # they are a bit funky due to how text sizes can vary
-    KEY_LABEL_OFFSETS = {
+    KEY_SPRITE_OFFSETS = {
         KEY_UP: (1, 28),
         KEY_LEFT: (-26, 0),
         KEY_DOWN: (1, -30),
         KEY_RIGHT: (28, 0)
     }
 
-    def __init__(self, *, pos, player_batch=None, ui_batch=None, **kwargs):
+    SIZE = Vec2d(32, 32)
+    heatmap = 'player'
+
+    # Start blinking when there's 1.5 sec until the key will change
+    KEY_BLINK_START = 1.5
+    # Fully blink in and out every 0,5 sec
+    KEY_BLINK_INTERVAL = 0.5
+
+    def __init__(self, *, pos, player_batch=None, ui_batch=None, input_latency=None, **kwargs):
         # Assign a body and shape
-        size = (32, 32)
         mass = 50
-        body = pymunk.Body(mass, pymunk.moment_for_box(mass, size))
-        shape = pymunk.Poly.create_box(body, size, 2)
+        body = pymunk.Body(mass, pymunk.moment_for_box(mass, self.SIZE))
+        shape = pymunk.Poly.create_box(body, self.SIZE, 2)
         shape.collision_type = CollisionType.Player
         shape.filter = pymunk.ShapeFilter(categories=CollisionType.Player,
                                           mask=pymunk.ShapeFilter.ALL_MASKS ^ CollisionType.WallSensor)
@@ -51,28 +56,10 @@ class Player(Actor):
         # Speed that is slightly higher than EnemyPawn but slower than EnemySlider
         self.speed = 40
 
-        # Current keys that when pressed move in a certain direction
-        self.keys = {
-            self.KEY_UP: pyglet_key.W,
-            self.KEY_LEFT: pyglet_key.A,
-            self.KEY_DOWN: pyglet_key.S,
-            self.KEY_RIGHT: pyglet_key.D
-        }
-
-        # Label for each key
-        # This is a defaultdict with a partial, simply so we don't need to init the dictionary ourselves
-        # As soon as self.key_labels[KEY_LEFT] is accessed the label will be created
-        self.key_labels = defaultdict(partial(
-            Label,
-            anchor_x='center',
-            anchor_y='center',
-            align='center',
-            width=32,
-            height=32,
-            font_size=24,
-            font_name='m5x7',
-            batch=ui_batch,
-        ))
+        # Sprite showing the key for each direction
+        # These use pre-rendered glyphs (see resources) so we never need to lay out text while playing
+        self.key_sprites = {key: Sprite(img=resources.key_glyph_images['W'], batch=ui_batch)
+                            for key in self.MOVEMENT_DELTAS.keys()}
         # The keys that are allowed as movement keys
         # A-Z + 0-9
         self.possible_keys = set(ord(x) for x in (string.digits + string.ascii_lowercase))
@@ -81,6 +68,32 @@ class Player(Actor):
         # Effectively how often (in sec) to randomize a key
         self.key_timer_min = 5
         self.key_timer_max = 15
+
+        # The key handler will remember which keys are pressed/released, until the start of the next tick
+        self.key_handler = KeyInput()
+        self.event_handlers = [self.key_handler]
+        # Measures how long it takes for key presses to affect us, if set
+        self.input_latency = input_latency
+
+        # Set up keys and timers
+        self.reset(pos)
+
+    def reset(self, pos):
+        """Puts the player at pos with the default keys, ready for a new game."""
+        self.pos = pos
+        self.body.velocity = (0, 0)
+        self.position = pos
+
+        # Current keys that when pressed move in a certain direction
+        self.keys = {
+            self.KEY_UP: pyglet_key.W,
+            self.KEY_LEFT: pyglet_key.A,
+            self.KEY_DOWN: pyglet_key.S,
+            self.KEY_RIGHT: pyglet_key.D
+        }
+        # Forget about keys that were held down when the last game ended
+        self.key_handler.clear()
+
         # Timer that goes down and when reaches 0 a key will be randomized
         self.key_timer = random.randrange(self.key_timer_min, self.key_timer_max)
         # A list of directions (up, left, right, down) but randomized
@@ -88,16 +101,21 @@ class Player(Actor):
         # we make sure that all the directions are chosen with equal frequency
         self.key_directions_randomised = []
         # The next direction key that will change
-        # We need this so we can blink the label right before the key changes
+        # We need this so we can blink the key sprite right before the key changes
         self.next_direction = self._get_next_direction()
-
-        # The key handler will remember which keys are pressed/released
-        self.key_handler = pyglet_key.KeyStateHandler()
-        self.event_handlers = [self.key_handler]
+        # Show the right keys, and make sure none are stuck halfway through a blink
+        for key, sprite in self.key_sprites.items():
+            animator.stop(sprite)
+            self._update_key_sprite(key)
+            sprite.opacity = 255
+        self.play_key_blink()
 
     def tick(self, dt: float):
         super().tick(dt)
 
+        # Apply the key presses and releases since last tick
+        presses = self.key_handler.apply()
+
         # For each movement key
         vel = Vec2d()
         for key, delta in self.MOVEMENT_DELTAS.items():
@@ -108,16 +126,18 @@ class Player(Actor):
 
         # Then make sure the velocity is normalized (so we always move the same speed even diagonally)
         self.body.velocity = vel.normalized() * self.speed
-
-        # For each movement key
-        for key in self.MOVEMENT_DELTAS.keys():
-            # Update the label position
-            label = self.key_labels[key]
-            offset = self.KEY_LABEL_OFFSETS[key]
-            label.x = self.x + offset[0]
-            label.y = self.y + offset[1]
-            # And also the label text, making sure the key is played as uppercase
-            label.text = chr(self.keys[key]).upper()
+        # Presses of movement keys have now made it into our velocity
+        if self.input_latency is not None:
+            movement_keys = self.keys.values()
+            for timestamp, symbol in presses:
+                if symbol in movement_keys:
+                    self.input_latency.applied(timestamp)
+
+        # Move the key sprites along with us
+        x, y = self.pos
+        for key, sprite in self.key_sprites.items():
+            offset = self.KEY_SPRITE_OFFSETS[key]
+            sprite.update(x=x + offset[0], y=y + offset[1])
 
         # Decrease the key timer by a 1 each second
         self.key_timer -= 1 * dt
@@ -128,30 +148,47 @@ class Player(Actor):
             self.key_timer = random.randrange(self.key_timer_min, self.key_timer_max)
             # Randomize the key
             self._randomise_movement_key()
-            # Then make sure all the labels are visible
-            # Due to how the blink works, and small differences in the FPS of the game, this is required
-            for key in self.MOVEMENT_DELTAS.keys():
-                label = self.key_labels[key]
-                label.color = (255, 255, 255, 255)
-
-        # Start blinking when there's 1.5 sec until the key will change
-        next_key_blink_start = 1.5
-        # Fully blink in and out every 0,5 sec
-        next_key_blink_interval = 0.5
-        if self.key_timer < next_key_blink_start:
-            # Figure out actual blink interval, by float mod
-            next_key_blink = math.fmod(self.key_timer, next_key_blink_interval)
-            # Then set the color (alpha) of the key to be blinking
-            self.key_labels[self.next_direction].color = blink(next_key_blink, pytweening.easeInCubic,
-                                                               pytweening.easeOutCubic, next_key_blink_interval,
-                                                               (255, 255, 255))
+            # And blink the next one before it changes
+            self.play_key_blink()
+
+    def play_key_blink(self):
+        """Blinks the sprite of the next key to change during the last KEY_BLINK_START sec of the key timer."""
+        # Due to how the blink works, and small differences in the FPS of the game, the sprite has to be made fully
+        # visible again once it's done
+        animator.play(self.key_sprites[self.next_direction], 'opacity', self._key_blink,
+                      delay=self.key_timer - self.KEY_BLINK_START, duration=self.KEY_BLINK_START, then=255)
+
+    def _key_blink(self, elapsed):
+        # Figure out how far into the actual blink interval we are (counting down like the key timer), by float mod
+        next_key_blink = math.fmod(self.KEY_BLINK_START - elapsed, self.KEY_BLINK_INTERVAL)
+        # Then find the alpha of the key
+        return blink(next_key_blink, pytweening.easeInCubic, pytweening.easeOutCubic, self.KEY_BLINK_INTERVAL,
+                     (255, 255, 255))[3]
+
+    def activate(self):
+        super().activate()
+        for sprite in self.key_sprites.values():
+            sprite.visible = True
+
+    def deactivate(self):
+        super().deactivate()
+        for sprite in self.key_sprites.values():
+            sprite.visible = False
 
     def _randomise_movement_key(self):
         # Pick a key from a the possible keys as long as we're not already using it
+        old_key = self.keys[self.next_direction]
         self.keys[self.next_direction] = random.choice(tuple(self.possible_keys - set(self.keys.values())))
+        analytics.event('rebind', self.pos, direction=self.next_direction, old=pyglet_key.symbol_string(old_key),
+                        new=pyglet_key.symbol_string(self.keys[self.next_direction]))
+        self._update_key_sprite(self.next_direction)
         # Then get a new direction for the next key to change
         self.next_direction = self._get_next_direction()
 
+    def _update_key_sprite(self, key):
+        """Swap the texture of the sprite for key to show the current key (uppercase)."""
+        self.key_sprites[key].image = resources.key_glyph_images[chr(self.keys[key]).upper()]
+
     def _get_next_direction(self):
         # If we are out of keys in the list
         if not self.key_directions_randomised:
@@ -165,7 +202,6 @@ class Player(Actor):
 
     def delete(self):
         # Make sure we delete our children
-        for key in self.MOVEMENT_DELTAS.keys():
-            label = self.key_labels[key]
-            label.delete()
+        for sprite in self.key_sprites.values():
+            sprite.delete()
         super().delete()
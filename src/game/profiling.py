@@ -0,0 +1,114 @@
+"""Lightweight timing and counter instrumentation for the game loop."""
+import math
+import time
+from functools import partial
+from contextlib import nullcontext
+from collections import defaultdict, deque
+
+
+class _Measurement:
+    """Context manager returned by Profiler.measure() that times the block it wraps."""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.profiler.tracer is not None:
+            self.profiler.tracer.begin(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        if self.profiler.tracer is not None:
+            self.profiler.tracer.end(self.name)
+
+
+class _Span:
+    """Context manager returned by Profiler.trace() that only emits trace events."""
+    __slots__ = ('tracer', 'name')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.tracer.begin(self.name)
+        return self
+
+    def __exit__(self, *_):
+        self.tracer.end(self.name)
+
+
+# Returned by Profiler.trace() when there's no tracer, so tracing costs next to nothing when disabled
+_NO_SPAN = nullcontext()
+
+
+class Profiler:
+    """Keeps a rolling history of timings (in seconds) and a set of counters.
+
+    Timings are kept in bounded deques so the profiler can stay enabled for a whole session."""
+
+    def __init__(self, history=600):
+        # Rolling timing samples for each name
+        self.timings = defaultdict(partial(deque, maxlen=history))
+        # Rolling samples of other values than time (eg. allocations per tick)
+        self.samples = defaultdict(partial(deque, maxlen=history))
+        # Counters that only ever go up (eg. total number of something)
+        self.counters = defaultdict(int)
+        # Optional tracing.Tracer that measure() and trace() blocks are also sent to
+        self.tracer = None
+
+    def measure(self, name):
+        """Time a block of code, eg. `with profiler.measure('tick'): ...`"""
+        return _Measurement(self, name)
+
+    def trace(self, name):
+        """Mark a block of code in the trace without keeping timings for it.
+
+        Meant for things that happen many times a tick (eg. ticking each object) where only the timeline matters."""
+        if self.tracer is None:
+            return _NO_SPAN
+        return _Span(self.tracer, name)
+
+    def record(self, name, seconds):
+        """Add a single timing sample."""
+        self.timings[name].append(seconds)
+
+    def sample(self, name, value):
+        """Add a single sample of something that isn't a timing."""
+        self.samples[name].append(value)
+
+    def count(self, name, amount=1):
+        """Increase a counter."""
+        self.counters[name] += amount
+
+    def clear(self):
+        """Throw away all timings, samples and counters."""
+        self.timings.clear()
+        self.samples.clear()
+        self.counters.clear()
+
+    def summary(self, name):
+        """Returns p50, p99 and max of the timing samples for name in milliseconds."""
+        samples = sorted(self.timings[name])
+        if not samples:
+            return {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        return {
+            'p50': percentile(samples, 50) * 1000,
+            'p99': percentile(samples, 99) * 1000,
+            'max': samples[-1] * 1000,
+        }
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, math.ceil(pct / 100 * len(samples)) - 1)
+    return samples[index]
+
+
+# The profiler everything in the game reports to
+profiler = Profiler()
@@ -0,0 +1,121 @@
+import numpy as np
+from pyglet import gl
+
+from . import GameObject, Player, WIDTH, HEIGHT, SUBSTEPS, profiler
+
+
+class ProjectileStore(GameObject):
+    """Every projectile in the game.
+
+    There can be thousands of projectiles at once, far too many for an Actor (with a body and a sprite) each.
+    Instead they are stored as a struct of NumPy arrays (positions, velocities and lifetimes), moved and tested
+    against the player with a handful of array operations each tick, and drawn from a single vertex list.
+
+    Live projectiles are always kept at the start of the arrays, so the first self.count entries are the live ones."""
+    # Half the width/height of a projectile
+    RADIUS = 4
+    # How far the player is pushed by each projectile that hits them
+    KNOCKBACK = 16
+    COLOR = (255, 96, 64, 255)
+    # Corners of a projectile's quad relative to its position
+    CORNERS = np.array([(-RADIUS, -RADIUS), (RADIUS, -RADIUS), (RADIUS, RADIUS), (-RADIUS, RADIUS)], np.float32)
+
+    def __init__(self, *, player: Player, batch, group=None, capacity=16384):
+        super().__init__()
+        self.player = player
+        self.capacity = capacity
+
+        self.positions = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocities = np.zeros((capacity, 2), dtype=np.float32)
+        self.lifetimes = np.zeros(capacity, dtype=np.float32)
+        self.count = 0
+
+        # One quad for every projectile we could ever have, unused ones are collapsed to a single point
+        self.vertex_list = batch.add(capacity * 4, gl.GL_QUADS, group, 'v2f/stream', 'c4B/static')
+        np.ctypeslib.as_array(self.vertex_list.colors).reshape(-1, 4)[:] = self.COLOR
+        # How many quads currently have vertices, so we know which ones to collapse
+        self._drawn = 0
+        self.visible = True
+
+    def fire(self, origin, angles, speed, lifetime):
+        """Fires a projectile from origin in the direction of each angle (in radians).
+
+        Projectiles that don't fit in the store are dropped."""
+        angles = np.asarray(angles, dtype=np.float32)
+        amount = min(len(angles), self.capacity - self.count)
+        if amount < len(angles):
+            profiler.count('projectiles.dropped', len(angles) - amount)
+        new = slice(self.count, self.count + amount)
+        angles = angles[:amount]
+        self.positions[new] = origin
+        self.velocities[new, 0] = np.cos(angles) * speed
+        self.velocities[new, 1] = np.sin(angles) * speed
+        self.lifetimes[new] = lifetime
+        self.count += amount
+
+    def clear(self):
+        """Removes every projectile."""
+        self.count = 0
+        self._update_vertices()
+
+    def tick(self, dt: float):
+        count = self.count
+        if count:
+            positions = self.positions[:count]
+            velocities = self.velocities[:count]
+            lifetimes = self.lifetimes[:count]
+            # Move the same distance a body would, since they get stepped SUBSTEPS times per tick
+            positions += velocities * (dt * SUBSTEPS)
+            lifetimes -= dt
+
+            # Test against the player's box
+            x, y = positions[:, 0], positions[:, 1]
+            player_x, player_y = self.player.pos
+            reach_x, reach_y = Player.SIZE / 2 + (self.RADIUS, self.RADIUS)
+            hit = (np.abs(x - player_x) < reach_x) & (np.abs(y - player_y) < reach_y)
+            if hit.any():
+                # Push the player in the direction the projectiles that hit them were going
+                push = velocities[hit].sum(axis=0)
+                length = np.hypot(*push)
+                hits = int(np.count_nonzero(hit))
+                if length > 0:
+                    dx, dy = push / length * self.KNOCKBACK * hits
+                    self.player.pos += (float(dx), float(dy))
+                profiler.count('projectiles.hits', hits)
+
+            # Projectiles die when they hit the player, run out of time or leave the window
+            alive = ((lifetimes > 0) & ~hit & (x > -self.RADIUS) & (x < WIDTH + self.RADIUS) &
+                     (y > -self.RADIUS) & (y < HEIGHT + self.RADIUS))
+            if not alive.all():
+                # Move the survivors to the start of the arrays
+                keep = np.flatnonzero(alive)
+                self.count = len(keep)
+                self.positions[:self.count] = positions[keep]
+                self.velocities[:self.count] = velocities[keep]
+                self.lifetimes[:self.count] = lifetimes[keep]
+
+        self._update_vertices()
+        profiler.sample('projectiles.live', self.count)
+
+    def _update_vertices(self):
+        """Moves the quads to where the projectiles are, and collapses the ones that aren't used."""
+        drawn = self.count if self.visible else 0
+        if drawn == 0 and self._drawn == 0:
+            return
+        vertices = np.ctypeslib.as_array(self.vertex_list.vertices).reshape(-1, 4, 2)
+        vertices[:drawn] = self.positions[:drawn, np.newaxis, :] + self.CORNERS
+        if drawn < self._drawn:
+            vertices[drawn:self._drawn] = 0
+        self._drawn = drawn
+
+    def activate(self):
+        self.visible = True
+        self._update_vertices()
+
+    def deactivate(self):
+        self.visible = False
+        self._update_vertices()
+
+    def delete(self):
+        self.vertex_list.delete()
+        super().delete()
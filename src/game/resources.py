@@ -1,6 +1,10 @@
+import string
+
 from pyglet import resource, font
 from pyglet.image import SolidColorImagePattern
 
+from . import asset_cache
+
 # Make our resource imports relative to the src/resources/ directory.
 resource.path = ['resources']
 resource.reindex()
@@ -15,17 +19,28 @@ def _set_anchor_center(img):
 player_image = SolidColorImagePattern((255, 255, 255, 255)).create_image(32, 32)
 _set_anchor_center(player_image)
 
-enemy_pawn_image = resource.image('enemy/pawn.png')
-_set_anchor_center(enemy_pawn_image)
-
-enemy_slider_image = resource.image('enemy/slider.png')
-_set_anchor_center(enemy_slider_image)
+# Images are decoded once and cached (see asset_cache), together with pre-rendered glyphs
+# for the key indicators shown next to the player (A-Z + 0-9)
+IMAGE_FILES = ['enemy/pawn.png', 'enemy/slider.png', 'enemy/turret.png', 'pellet.png', 'danger.png']
+GLYPH_SETS = [asset_cache.GlyphSet('key', 'm5x7.ttf', 'm5x7', 24, string.ascii_uppercase + string.digits, 32)]
+_assets = asset_cache.load(IMAGE_FILES, GLYPH_SETS)
 
-pellet_image = resource.image('pellet.png')
-_set_anchor_center(pellet_image)
+# All of these are anchored in the center
+enemy_pawn_image = _assets['enemy/pawn.png']
+enemy_slider_image = _assets['enemy/slider.png']
+enemy_turret_image = _assets['enemy/turret.png']
+pellet_image = _assets['pellet.png']
+danger_image = _assets['danger.png']
 
-danger_image = resource.image('danger.png')
-_set_anchor_center(danger_image)
+# These are anchored so that a sprite is drawn exactly where a single character Label with width=height=32,
+# anchor_x='center', anchor_y='center' and align='center' would draw it
+key_glyph_images = {char: _assets[f'key/{char}'] for char in GLYPH_SETS[0].characters}
 
+# Labels still use the font directly, their glyphs aren't part of the cache (see asset_cache)
 resource.add_font('m5x7.ttf')
 font_m5x7 = font.load('m5x7')  # Only assigned so it doesn't get garbage collected immediately
+# pyglet only keeps the last few fonts it loaded alive, and we use more sizes than that. A label that is laid out
+# again after its font was collected loads a new one with new glyph textures, which the label's layout then holds on
+# to forever (leaking a texture every time a game ends). So hold on to every size that labels use.
+LABEL_FONT_SIZES = (32, 48, 64, 128, 512)
+fonts_m5x7 = {size: font.load('m5x7', size) for size in LABEL_FONT_SIZES}
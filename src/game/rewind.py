@@ -0,0 +1,415 @@
+"""Rewind buffer of compact game state snapshots.
+
+Copying a pymunk.Space is slow and our game objects can't be pickled, so instead every tick the state that matters
+for the simulation (bodies, slider moves, the player's keys and timers, the level's timers and counts, the score and
+the state of the random module) is packed into a small binary snapshot with struct.
+
+Every KEYFRAME_INTERVAL ticks the snapshot is a keyframe containing everything. In between, a snapshot is a delta that
+only contains the entity records that differ from the last keyframe (entities that don't move, like pellets, cost
+nothing). Restoring any tick therefore only ever needs one keyframe and at most one delta.
+
+Restoring isn't bit exact: positions are stored as 32 bit floats and pymunk keeps contact information between steps
+that isn't part of a snapshot, so a crowd of enemies may play out a little differently after a restore.
+
+Projectiles (see projectiles.py) aren't part of snapshots either, there can be thousands of them, so they're simply
+cleared on restore. Turrets remember where in their patterns they were, so they carry on firing as before.
+Particles are only for show, so they're left alone."""
+import random
+import struct
+from itertools import count
+
+from pymunk.vec2d import Vec2d
+
+from . import Player, EnemyPawn, EnemySlider, EnemyTurret, Pellet, profiler, animator
+from .waves import WAVES
+
+# Kinds of entities that are part of a snapshot, the index is stored in the snapshot
+KINDS = [Player, EnemyPawn, EnemySlider, Pellet, EnemyTurret]
+KIND_PLAYER, KIND_PAWN, KIND_SLIDER, KIND_PELLET, KIND_TURRET = range(len(KINDS))
+
+# Tick, whether it's a keyframe and the tick of the keyframe a delta is relative to
+HEADER = struct.Struct('<I?I')
+# Score, ticks since the level started, how many of each enemy type the level has spawned and how many enemies of
+# each wave are waiting to be spawned
+WORLD = struct.Struct('<II' + 'I' * len(WAVES.types) + 'I' * len(WAVES))
+# Position in the Mersenne Twister state of the random module, and whether the state itself follows
+RNG_HEADER = struct.Struct('<I?')
+RNG_STATE = struct.Struct('<624I')
+# Number of records that follow
+COUNT = struct.Struct('<H')
+# Entity id and kind, the start of every entity record
+ENTITY = struct.Struct('<IB')
+# Entity id, kind, body position, angle, velocity and angular velocity, sprite rotation and color
+_BODY = '<IB7f3B'
+# Full entity record of each kind
+RECORDS = [
+    # Body + keys, key timer, next direction to change, number of directions left and the directions left
+    struct.Struct(_BODY + '4HfB5B'),
+    # Body
+    struct.Struct(_BODY),
+    # Body + whether moving, whether the x axis is preferred, wait timer, move timer, start and end position
+    struct.Struct(_BODY + '??6f'),
+    # Body
+    struct.Struct(_BODY),
+    # Body + wait timer, next pattern, spiral shots left, spiral timer and angle
+    struct.Struct(_BODY + 'fBBff'),
+]
+# Id of a removed entity
+REMOVED = struct.Struct('<I')
+
+# How often to write a keyframe instead of a delta
+KEYFRAME_INTERVAL = 60
+
+
+class Snapshot:
+    """A decoded snapshot.
+
+    entities maps entity id to (kind, fields), where fields are the unpacked fields of the entity's record
+    (without the id and kind)."""
+
+    def __init__(self, tick, keyframe, base_tick):
+        self.tick = tick
+        self.keyframe = keyframe
+        # For deltas the keyframe it's relative to
+        self.base_tick = base_tick
+        self.score = 0
+        self.level_ticks = 0
+        self.spawned_enemies = ()
+        self.pending_spawns = ()
+        self.rng_pos = 0
+        # None if unchanged since the keyframe
+        self.rng_state = None
+        self.entities = {}
+        # Entities that existed in the keyframe but don't any more (deltas only)
+        self.removed = []
+
+    def merge(self, delta: 'Snapshot') -> 'Snapshot':
+        """Returns the full snapshot described by delta, assuming self is the keyframe it's relative to."""
+        merged = Snapshot(delta.tick, True, delta.tick)
+        merged.score = delta.score
+        merged.level_ticks = delta.level_ticks
+        merged.spawned_enemies = delta.spawned_enemies
+        merged.pending_spawns = delta.pending_spawns
+        merged.rng_pos = delta.rng_pos
+        merged.rng_state = self.rng_state if delta.rng_state is None else delta.rng_state
+        merged.entities = dict(self.entities)
+        merged.entities.update(delta.entities)
+        for entity_id in delta.removed:
+            merged.entities.pop(entity_id, None)
+        return merged
+
+    def differences(self, other: 'Snapshot'):
+        """What differs between this full snapshot and another one (apart from the tick), as a list of descriptions."""
+        found = [name for name in ('score', 'level_ticks', 'spawned_enemies', 'pending_spawns', 'rng_pos', 'rng_state')
+                 if getattr(self, name) != getattr(other, name)]
+        for entity_id in sorted(self.entities.keys() | other.entities.keys()):
+            ours = self.entities.get(entity_id)
+            theirs = other.entities.get(entity_id)
+            if ours != theirs:
+                kind = KINDS[(ours or theirs)[0]].__name__
+                found.append(f'{kind} {entity_id}: {ours and ours[1]} != {theirs and theirs[1]}')
+        return found
+
+
+def decode(data) -> Snapshot:
+    """Decodes a snapshot (keyframe or delta) as written by Rewind.capture()."""
+    snapshot = Snapshot(*HEADER.unpack_from(data))
+    offset = HEADER.size
+    snapshot.score, snapshot.level_ticks, *counts = WORLD.unpack_from(data, offset)
+    snapshot.spawned_enemies = tuple(counts[:len(WAVES.types)])
+    snapshot.pending_spawns = tuple(counts[len(WAVES.types):])
+    offset += WORLD.size
+    snapshot.rng_pos, has_state = RNG_HEADER.unpack_from(data, offset)
+    offset += RNG_HEADER.size
+    if has_state:
+        snapshot.rng_state = RNG_STATE.unpack_from(data, offset)
+        offset += RNG_STATE.size
+
+    entity_count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(entity_count):
+        entity_id, kind = ENTITY.unpack_from(data, offset)
+        record = RECORDS[kind]
+        snapshot.entities[entity_id] = (kind, record.unpack_from(data, offset)[2:])
+        offset += record.size
+
+    removed_count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(removed_count):
+        snapshot.removed.append(REMOVED.unpack_from(data, offset)[0])
+        offset += REMOVED.size
+    return snapshot
+
+
+# Packing the record of each kind of entity
+# These run for every entity every tick, so avoid anything that isn't needed. Reading a body property is surprisingly
+# slow (it goes through cffi and builds a Vec2d), so:
+#  - Positions come from the sprite when it's visible, since GameWindow._cull() has just moved it to where the body is
+#    (hidden sprites aren't moved, so those still read the body)
+#  - Kinematic bodies (sliders, pellets and turrets) never turn, and pellets and turrets never have a velocity either,
+#    so what can't change isn't read at all
+
+def _position(obj):
+    if obj.visible:
+        return obj.x, obj.y
+    # Unpacking a Vec2d is slower still than reading its x and y
+    position = obj.body.position
+    return position.x, position.y
+
+
+def _encode_player(entity_id, obj):
+    body = obj.body
+    x, y = _position(obj)
+    velocity = body.velocity
+    r, g, b = obj.color
+    keys = obj.keys
+    directions = obj.key_directions_randomised
+    return RECORDS[KIND_PLAYER].pack(entity_id, KIND_PLAYER, x, y, body.angle, velocity.x, velocity.y,
+                                     body.angular_velocity, obj.rotation, r, g, b,
+                                     *(keys[key] for key in Player.MOVEMENT_DELTAS), obj.key_timer,
+                                     obj.next_direction, len(directions), *directions, *(0,) * (4 - len(directions)))
+
+
+def _encode_pawn(entity_id, obj):
+    body = obj.body
+    x, y = _position(obj)
+    velocity = body.velocity
+    r, g, b = obj.color
+    return RECORDS[KIND_PAWN].pack(entity_id, KIND_PAWN, x, y, body.angle, velocity.x, velocity.y,
+                                   body.angular_velocity, obj.rotation, r, g, b)
+
+
+def _encode_slider(entity_id, obj):
+    body = obj.body
+    x, y = _position(obj)
+    velocity = body.velocity
+    r, g, b = obj.color
+    start_pos = obj.start_pos or Vec2d()
+    end_pos = obj.end_pos or Vec2d()
+    return RECORDS[KIND_SLIDER].pack(entity_id, KIND_SLIDER, x, y, 0.0, velocity.x, velocity.y, 0.0, obj.rotation,
+                                     r, g, b, obj.moving, obj.x_axis_preferred, obj.wait_timer, obj.move_timer,
+                                     start_pos.x, start_pos.y, end_pos.x, end_pos.y)
+
+
+def _encode_pellet(entity_id, obj):
+    x, y = _position(obj)
+    r, g, b = obj.color
+    return RECORDS[KIND_PELLET].pack(entity_id, KIND_PELLET, x, y, 0.0, 0.0, 0.0, 0.0, obj.rotation, r, g, b)
+
+
+def _encode_turret(entity_id, obj):
+    x, y = _position(obj)
+    r, g, b = obj.color
+    # Only the sprite turns
+    return RECORDS[KIND_TURRET].pack(entity_id, KIND_TURRET, x, y, 0.0, 0.0, 0.0, 0.0, obj.rotation, r, g, b,
+                                     obj.wait_timer, obj.pattern, obj.spiral_shots, obj.spiral_timer, obj.angle)
+
+
+# Entity type -> the function packing its record
+ENCODERS = {Player: _encode_player, EnemyPawn: _encode_pawn, EnemySlider: _encode_slider, Pellet: _encode_pellet,
+            EnemyTurret: _encode_turret}
+
+
+class Rewind:
+    """Fixed size ring buffer holding a snapshot of every tick of the current game.
+
+    Holds the last `capacity` ticks. Capturing costs one struct.pack per entity, restoring costs decoding
+    one keyframe and one delta no matter how far back we go."""
+
+    def __init__(self, window, capacity=600):
+        self.window = window
+        self.capacity = capacity
+        # Snapshot of every tick, indexed by tick % capacity
+        self.snapshots = [None] * capacity
+        # Keyframes, indexed by (tick // KEYFRAME_INTERVAL) % len(self.keyframes)
+        # Big enough that the keyframe of every delta in self.snapshots is still around
+        self.keyframes = [None] * (capacity // KEYFRAME_INTERVAL + 2)
+        # Oldest and newest tick we have a snapshot of
+        self.oldest = 0
+        self.newest = -1
+
+        # Every entity gets an id that stays the same for as long as it lives
+        self._ids = {}
+        self._next_id = count()
+        # Records and random state of the last keyframe, what deltas are relative to
+        self._keyframe_records = {}
+        self._keyframe_rng_state = None
+
+    def clear(self):
+        """Forget every snapshot, eg. when a new game starts."""
+        self.snapshots = [None] * self.capacity
+        self.keyframes = [None] * len(self.keyframes)
+        self.oldest = 0
+        self.newest = -1
+        self._ids = {}
+        self._keyframe_records = {}
+        self._keyframe_rng_state = None
+
+    def capture(self):
+        """Snapshots the current state of the game as the next tick."""
+        tick = self.newest + 1
+        keyframe = tick % KEYFRAME_INTERVAL == 0
+        self._ids, records = self._records()
+        _version, rng_state, _gauss_next = random.getstate()
+
+        if keyframe:
+            parts = self._encode_keyframe(tick, records, rng_state)
+            self._keyframe_records = records
+            self._keyframe_rng_state = rng_state[:624]
+        else:
+            parts = [HEADER.pack(tick, False, tick - tick % KEYFRAME_INTERVAL), self._encode_world()]
+            # Only the random state and records that changed since the keyframe
+            rng_words = rng_state[:624]
+            if rng_words == self._keyframe_rng_state:
+                parts.append(RNG_HEADER.pack(rng_state[624], False))
+            else:
+                parts.append(RNG_HEADER.pack(rng_state[624], True))
+                parts.append(RNG_STATE.pack(*rng_words))
+            keyframe_records = self._keyframe_records
+            changed = [record for entity_id, record in records.items() if keyframe_records.get(entity_id) != record]
+            parts.append(COUNT.pack(len(changed)))
+            parts.extend(changed)
+            removed = [entity_id for entity_id in keyframe_records if entity_id not in records]
+            parts.append(COUNT.pack(len(removed)))
+            parts.extend(REMOVED.pack(entity_id) for entity_id in removed)
+
+        data = b''.join(parts)
+        self.snapshots[tick % self.capacity] = data
+        if keyframe:
+            self.keyframes[tick // KEYFRAME_INTERVAL % len(self.keyframes)] = data
+        self.newest = tick
+        self.oldest = max(0, tick - self.capacity + 1)
+        profiler.sample('rewind.bytes', len(data))
+
+    def current(self) -> Snapshot:
+        """Full snapshot of the game as it is right now, without adding it to the buffer (eg. to check that restoring
+        a tick put everything back the way it was)."""
+        _ids, records = self._records()
+        _version, rng_state, _gauss_next = random.getstate()
+        return decode(b''.join(self._encode_keyframe(self.newest, records, rng_state)))
+
+    def _records(self):
+        """Ids and records of the entities that are alive now (giving new ones a new id)."""
+        old_ids = self._ids
+        ids = {}
+        records = {}
+        for obj in self.window.objects:
+            encode = ENCODERS.get(type(obj))
+            if encode is not None:
+                entity_id = old_ids.get(obj)
+                if entity_id is None:
+                    entity_id = next(self._next_id)
+                ids[obj] = entity_id
+                records[entity_id] = encode(entity_id, obj)
+        return ids, records
+
+    def _encode_world(self):
+        window = self.window
+        level = window.level
+        spawned = level.spawned_enemies
+        return WORLD.pack(window.ui.score, level.ticks, *(spawned[enemy_type] for enemy_type in WAVES.types),
+                          *level.pending)
+
+    def _encode_keyframe(self, tick, records, rng_state):
+        """The parts of a keyframe of tick."""
+        return [
+            HEADER.pack(tick, True, tick),
+            self._encode_world(),
+            RNG_HEADER.pack(rng_state[624], True),
+            RNG_STATE.pack(*rng_state[:624]),
+            COUNT.pack(len(records)),
+            *records.values(),
+            COUNT.pack(0),
+        ]
+
+    def latest(self):
+        """Encoded snapshot of the newest tick and the encoded keyframe it's relative to (the same if it is one)."""
+        return (self.snapshots[self.newest % self.capacity],
+                self.keyframes[self.newest // KEYFRAME_INTERVAL % len(self.keyframes)])
+
+    def snapshot(self, tick) -> Snapshot:
+        """Full (keyframe merged with delta) snapshot of tick."""
+        if not self.oldest <= tick <= self.newest:
+            raise IndexError(f'tick {tick} is not in the rewind buffer ({self.oldest}-{self.newest})')
+        snapshot = decode(self.snapshots[tick % self.capacity])
+        if snapshot.keyframe:
+            return snapshot
+        return self._keyframe(tick).merge(snapshot)
+
+    def _keyframe(self, tick) -> Snapshot:
+        """The keyframe that the snapshot of tick is (or would be) relative to."""
+        return decode(self.keyframes[tick // KEYFRAME_INTERVAL % len(self.keyframes)])
+
+    def restore(self, tick):
+        """Puts the game back to how it was at tick, and forgets every tick after it."""
+        snapshot = self.snapshot(tick)
+        window = self.window
+        alive = set(window.objects)
+
+        # Get rid of enemies and pellets that didn't exist yet (or had already died) at that tick
+        live = {entity_id: obj for obj, entity_id in self._ids.items() if obj in alive}
+        for entity_id, obj in live.items():
+            if entity_id not in snapshot.entities and obj is not window.player:
+                window._remove_game_object(obj)
+
+        ids = {}
+        for entity_id, (kind, fields) in snapshot.entities.items():
+            obj = live.get(entity_id)
+            if obj is None:
+                obj = self._create(kind, fields[:2])
+                window._add_game_object(obj)
+            self._apply(obj, kind, fields)
+            ids[obj] = entity_id
+        self._ids = ids
+
+        # Projectiles aren't part of snapshots
+        window.projectiles.clear()
+
+        window.ui.score = snapshot.score
+        window.level.ticks = snapshot.level_ticks
+        for enemy_type, spawned in zip(WAVES.types, snapshot.spawned_enemies):
+            window.level.spawned_enemies[enemy_type] = spawned
+        window.level.pending = list(snapshot.pending_spawns)
+        random.setstate((3, tuple(snapshot.rng_state) + (snapshot.rng_pos,), None))
+
+        # The ticks after this one didn't happen now, the next capture() continues from here
+        self.newest = tick
+        # And deltas written from now on are relative to the keyframe of this tick
+        keyframe = self._keyframe(tick)
+        self._keyframe_records = {entity_id: RECORDS[kind].pack(entity_id, kind, *fields)
+                                  for entity_id, (kind, fields) in keyframe.entities.items()}
+        self._keyframe_rng_state = keyframe.rng_state
+
+    def _create(self, kind, pos):
+        window = self.window
+        if kind == KIND_PELLET:
+            return Pellet(pos=pos, batch=window.main_batch, group=window.level.pellet_group)
+        return KINDS[kind](pos=pos, player=window.player, spatial=window.spatial, projectiles=window.projectiles,
+                           particles=window.particles, batch=window.main_batch, group=window.level.enemy_group)
+
+    @staticmethod
+    def _apply(obj, kind, fields):
+        x, y, angle, vx, vy, angular_velocity, rotation, r, g, b = fields[:10]
+        obj.body.position = (x, y)
+        obj.body.angle = angle
+        obj.body.velocity = (vx, vy)
+        obj.body.angular_velocity = angular_velocity
+        obj.rotation = rotation
+        obj.color = (r, g, b)
+        extra = fields[10:]
+        if kind == KIND_PLAYER:
+            *keys, obj.key_timer, obj.next_direction, directions_left = extra[:7]
+            obj.key_directions_randomised = list(extra[7:7 + directions_left])
+            for direction, key in zip(Player.MOVEMENT_DELTAS, keys):
+                obj.keys[direction] = key
+                obj._update_key_sprite(direction)
+                animator.stop(obj.key_sprites[direction])
+            obj.play_key_blink()
+        elif kind == KIND_SLIDER:
+            obj.moving, obj.x_axis_preferred, obj.wait_timer, obj.move_timer = extra[:4]
+            obj.start_pos = Vec2d(extra[4], extra[5])
+            obj.end_pos = Vec2d(extra[6], extra[7])
+            obj.play_wait_colors()
+        elif kind == KIND_TURRET:
+            obj.wait_timer, obj.pattern, obj.spiral_shots, obj.spiral_timer, obj.angle = extra
+            obj.play_wait_colors()
@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+import pymunk
+
+from . import GameObject
+
+
+class Scene:
+    """A set of game objects (eg. the menu, or the player and in game UI) that is built once and kept around.
+
+    Activating and deactivating a scene only toggles the visibility and event subscriptions of its objects,
+    so switching between scenes doesn't need to rebuild any sprites, labels or physics."""
+
+    def __init__(self, window, space: Optional[pymunk.Space] = None, idle=False):
+        self.window = window
+        # Physics space that should be stepped while this scene is active (if any)
+        self.space = space
+        # Whether the scene is mostly static (eg. a menu), so it only needs ticking at IDLE_TPS and redrawing when
+        # something changes
+        self.idle = idle
+        # The objects that make up the scene, these live as long as the scene does
+        self.objects: List[GameObject] = []
+        self.active = False
+
+    def add(self, obj: GameObject):
+        """Adds an object to the scene. It'll be hidden until the scene is activated."""
+        self.objects.append(obj)
+        if self.space is not None:
+            if hasattr(obj, 'body'):
+                self.space.add(obj.body)
+            if hasattr(obj, 'shape'):
+                self.space.add(obj.shape)
+        obj.deactivate()
+
+    def activate(self):
+        """Shows every object in the scene and lets them receive events."""
+        for obj in self.objects:
+            obj.activate()
+            self.window.event_bus.subscribe(obj, obj.event_handlers)
+        self.active = True
+
+    def deactivate(self):
+        """Hides every object in the scene and stops them from receiving events."""
+        for obj in self.objects:
+            obj.deactivate()
+            self.window.event_bus.unsubscribe(obj)
+        self.active = False
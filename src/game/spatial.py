@@ -0,0 +1,171 @@
+import math
+
+from pymunk.vec2d import Vec2d
+
+from . import WIDTH, HEIGHT
+
+
+class SpatialQueries:
+    """Spatial queries shared by everything in the game.
+
+    Results are memoized until the next call to begin_tick(), so it doesn't matter how many objects ask the same
+    question in a tick. To find free places to spawn, the window is split into a uniform grid of cells that keeps
+    count of how many tracked objects (enemies and the player) cover each cell. The grid is updated incrementally:
+    objects that never move (see Actor.moves) are left alone after they're tracked, and of the rest only the ones
+    whose position changed since the last tick have their cells worked out again."""
+    # Size of a grid cell in px
+    CELL_SIZE = 64
+
+    def __init__(self, *, player):
+        self.player = player
+        self.columns = math.ceil(WIDTH / self.CELL_SIZE)
+        self.rows = math.ceil(HEIGHT / self.CELL_SIZE)
+        # Number of tracked objects covering each cell, indexed by row * self.columns + column
+        self.occupancy = [0] * (self.columns * self.rows)
+        # The cells each tracked object covered last time the grid was updated
+        self._covered = {}
+        # The position of each tracked object that moves, last time the grid was updated
+        self._positions = {}
+        # Results of queries made this tick
+        self._memo = {}
+        self.track(player)
+
+    def begin_tick(self):
+        """Forget about last tick's results and update the occupancy grid."""
+        self._memo.clear()
+        positions = self._positions
+        for obj, last_pos in positions.items():
+            pos = obj.pos
+            if pos == last_pos:
+                continue
+            positions[obj] = pos
+            cells = self._covered[obj]
+            new_cells = self._cells_for(pos, obj.SIZE)
+            if new_cells != cells:
+                self._fill(cells, -1)
+                self._fill(new_cells, 1)
+                self._covered[obj] = new_cells
+
+    def track(self, obj):
+        """Start tracking obj (which needs a pos and a SIZE) in the occupancy grid, if it isn't already."""
+        if obj in self._covered:
+            return
+        pos = obj.pos
+        cells = self._cells_for(pos, obj.SIZE)
+        self._fill(cells, 1)
+        self._covered[obj] = cells
+        if obj.moves:
+            self._positions[obj] = pos
+        self._memo.clear()
+
+    def untrack(self, obj):
+        """Stop tracking obj in the occupancy grid."""
+        cells = self._covered.pop(obj, None)
+        self._positions.pop(obj, None)
+        if cells is not None:
+            self._fill(cells, -1)
+            self._memo.clear()
+
+    def _cells_for(self, pos, size):
+        """Range of cells (first column, first row, last column, last row) covered by a box at pos."""
+        half_x, half_y = size[0] / 2, size[1] / 2
+        return (self._clamp_column(int((pos[0] - half_x) // self.CELL_SIZE)),
+                self._clamp_row(int((pos[1] - half_y) // self.CELL_SIZE)),
+                self._clamp_column(int((pos[0] + half_x - 1) // self.CELL_SIZE)),
+                self._clamp_row(int((pos[1] + half_y - 1) // self.CELL_SIZE)))
+
+    def _clamp_column(self, column):
+        return min(max(column, 0), self.columns - 1)
+
+    def _clamp_row(self, row):
+        return min(max(row, 0), self.rows - 1)
+
+    def _fill(self, cells, amount):
+        first_column, first_row, last_column, last_row = cells
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                self.occupancy[row * self.columns + column] += amount
+
+    def _is_free(self, cells):
+        first_column, first_row, last_column, last_row = cells
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                if self.occupancy[row * self.columns + column]:
+                    return False
+        return True
+
+    def is_free(self, pos, size) -> bool:
+        """Whether a box of size at pos would only cover cells nothing else is in."""
+        return self._is_free(self._cells_for(pos, size))
+
+    def free_spawn_cells(self, size):
+        """Positions (centers of cell aligned boxes) inside the window where a box of size wouldn't overlap
+        anything that is tracked."""
+        key = ('free', size[0], size[1])
+        if key not in self._memo:
+            width = math.ceil(size[0] / self.CELL_SIZE)
+            height = math.ceil(size[1] / self.CELL_SIZE)
+            positions = []
+            for row in range(self.rows - height + 1):
+                for column in range(self.columns - width + 1):
+                    if self._is_free((column, row, column + width - 1, row + height - 1)):
+                        positions.append(Vec2d((column + width / 2) * self.CELL_SIZE,
+                                               (row + height / 2) * self.CELL_SIZE))
+            self._memo[key] = positions
+        return self._memo[key]
+
+    def nearest_free_spawn(self, pos, size):
+        """pos if a box of size is free to spawn there, otherwise the closest free position (None if there's none)."""
+        if self.is_free(pos, size):
+            return pos
+        free = self.free_spawn_cells(size)
+        if not free:
+            return None
+        return min(free, key=lambda position: position.get_dist_sqrd(pos))
+
+    def nearest_wall_point(self, pos):
+        """Where a ray from the center of the window through pos hits the window edge (None if pos is the center).
+
+        This is where the edge is closest from the point of view of something at pos running away from the center,
+        even in the corners (where two walls meet)."""
+        key = ('wall', pos[0], pos[1])
+        if key not in self._memo:
+            center = Vec2d(WIDTH, HEIGHT) / 2
+            direction = Vec2d(pos) - center
+            point = None
+            if direction.get_length_sqrd() > 0:
+                # Scale the direction so it just reaches whichever edge it reaches first
+                scales = []
+                if direction.x:
+                    scales.append(center.x / abs(direction.x))
+                if direction.y:
+                    scales.append(center.y / abs(direction.y))
+                point = center + direction * min(scales)
+            self._memo[key] = point
+        return self._memo[key]
+
+    def player_pos(self) -> Vec2d:
+        """Where the player is this tick."""
+        if 'player' not in self._memo:
+            self._memo['player'] = Vec2d(self.player.pos)
+        return self._memo['player']
+
+    def vector_to_player(self, pos) -> Vec2d:
+        """Vector from pos to the player."""
+        return self.player_pos() - pos
+
+    def distance_to_player(self, pos) -> float:
+        """Distance from pos to the player."""
+        return self.vector_to_player(pos).length
+
+    def line_of_sight(self, pos, tolerance):
+        """Whether the player can be reached from pos by moving along only one axis.
+
+        Returns 'x' if the player is within tolerance vertically (so moving along x would hit them),
+        'y' if the player is within tolerance horizontally, or None if neither."""
+        delta = self.vector_to_player(pos)
+        if -tolerance < delta.y < tolerance:
+            return 'x'
+        if -tolerance < delta.x < tolerance:
+            return 'y'
+        return None
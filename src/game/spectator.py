@@ -0,0 +1,163 @@
+"""Streams the game to spectators (see src/spectator_viewer.py) over a local TCP or Unix socket.
+
+The stream reuses the snapshots from the rewind buffer (see rewind.py), each sent as a 4 byte length followed by the
+snapshot. A client first gets the current keyframe and then every tick's snapshot. Since deltas are relative to the
+last keyframe rather than the tick before, a client that can't keep up can simply skip deltas, it only needs to be
+sent the next keyframe when there's room again.
+
+The sockets are handled by asyncio in a thread of their own, so the game loop only ever hands a snapshot over and
+never waits on a client."""
+import asyncio
+import os
+import struct
+import threading
+
+from .profiling import percentile
+
+# Length of the snapshot that follows
+FRAME_HEADER = struct.Struct('<I')
+
+
+def parse_address(address):
+    """Splits an address into ('unix', path) or ('tcp', (host, port)).
+
+    Unix sockets are given as "unix:<path>" and TCP as "<host>:<port>"."""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class _Client:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        # The keyframe this client has last been sent, deltas are useless without it
+        self.keyframe = None
+
+
+class SpectatorPublisher:
+    """Accepts spectators on address and sends them each published snapshot."""
+    DEFAULT_ADDRESS = '127.0.0.1:7777'
+    # Skip sending to a client while this many bytes are still waiting to be sent to it
+    HIGH_WATER = 256 * 1024
+
+    def __init__(self, address, profiler):
+        self.address = address
+        self.profiler = profiler
+
+        # Only touched from the asyncio thread
+        self._clients = set()
+        self._keyframe = None
+        self._keyframe_frame = None
+        self._server = None
+        # Totals for the whole session, since the profiler only keeps the last few seconds
+        self.bytes_sent = 0
+        self.snapshots = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='spectator', daemon=True)
+        self._thread.start()
+        # Wait for the server to be listening, so we can complain if the address is taken
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(self._start_server())
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        self._loop.run_forever()
+
+        # Stopped from self.close()
+        self._server.close()
+        for client in self._clients:
+            client.writer.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    async def _start_server(self):
+        kind, address = parse_address(self.address)
+        if kind == 'unix':
+            # Remove a socket left behind by a previous run
+            if os.path.exists(address):
+                os.remove(address)
+            return await asyncio.start_unix_server(self._on_client, address)
+        return await asyncio.start_server(self._on_client, *address)
+
+    async def _on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        self._clients.add(client)
+        self.profiler.count('spectator.connected')
+        try:
+            # Spectators never send anything, so this returns when they disconnect
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    def publish(self, snapshot: bytes, keyframe: bytes):
+        """Sends snapshot (relative to keyframe) to every spectator. Called from the game loop, never blocks."""
+        self._loop.call_soon_threadsafe(self._send, snapshot, keyframe)
+
+    def _send(self, snapshot, keyframe):
+        if keyframe is not self._keyframe:
+            self._keyframe = keyframe
+            self._keyframe_frame = FRAME_HEADER.pack(len(keyframe)) + keyframe
+        frame = FRAME_HEADER.pack(len(snapshot)) + snapshot
+
+        sent = 0
+        for client in self._clients:
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            # Don't let a slow client pile up snapshots, it'll get the next keyframe once it catches up
+            if transport.get_write_buffer_size() > self.HIGH_WATER:
+                self.profiler.count('spectator.skipped')
+                continue
+            if client.keyframe is not keyframe:
+                client.keyframe = keyframe
+                client.writer.write(self._keyframe_frame)
+                sent += len(self._keyframe_frame)
+                # The snapshot is the keyframe itself, no need to send it twice
+                if snapshot is keyframe:
+                    continue
+            client.writer.write(frame)
+            sent += len(frame)
+        self.profiler.sample('spectator.bytes', sent)
+        self.bytes_sent += sent
+        self.snapshots += 1
+
+    def close(self):
+        """Disconnects every spectator and stops listening."""
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        kind, address = parse_address(self.address)
+        if kind == 'unix' and os.path.exists(address):
+            os.remove(address)
+
+    def report(self):
+        """Bandwidth used and time spent publishing as text. Call after close() so every snapshot is counted."""
+        counters = self.profiler.counters
+        sent = sorted(self.profiler.samples['spectator.bytes'])
+        publish = self.profiler.summary('spectator.publish')
+        lines = [f'Spectators: {counters["spectator.connected"]} connected, '
+                 f'{counters["spectator.skipped"]} snapshots skipped for slow clients',
+                 f'Sent {self.bytes_sent} bytes for {self.snapshots} ticks '
+                 f'({self.bytes_sent / max(self.snapshots, 1):.0f} bytes/tick)',
+                 f'Last {len(sent)} ticks:',
+                 f'{"":>10}{"p50":>10}{"p99":>10}{"max":>10}']
+        if sent:
+            lines.append(f'{"bytes":>10}{percentile(sent, 50):>10}{percentile(sent, 99):>10}{sent[-1]:>10}')
+        lines.append(f'{"publish":>10}' + ''.join(f'{publish[stat]:>10.3f}' for stat in ('p50', 'p99', 'max'))
+                     + '  (ms)')
+        return '\n'.join(lines)
@@ -0,0 +1,78 @@
+"""Optional tracer that writes per-frame timelines in the Chrome trace event format.
+
+The resulting file can be opened in chrome://tracing or https://ui.perfetto.dev to see a flame chart of every frame."""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class Tracer:
+    """Records begin/end events into a bounded ring buffer that a background thread periodically writes to disk.
+
+    Recording is cheap (a tuple appended to a deque), all formatting happens on the writer thread.
+    If the writer can't keep up the oldest events are dropped rather than slowing down the game."""
+
+    def __init__(self, filename, capacity=100000, flush_interval=1.0):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        # Ring buffer of (phase, name, timestamp) tuples
+        self.events = deque(maxlen=capacity)
+        # How many events were overwritten before the writer got to them
+        self.dropped = 0
+
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._tid = threading.get_ident()
+        self._first = True
+
+        self._file = open(filename, 'w')
+        # JSON array format, which chrome and perfetto can read even if the closing ] is missing (eg. after a crash)
+        self._file.write('[\n')
+        self._write_event({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': self._tid,
+                           'args': {'name': 'game loop'}})
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace writer', daemon=True)
+        self._thread.start()
+
+    def begin(self, name):
+        self._add('B', name)
+
+    def end(self, name):
+        self._add('E', name)
+
+    def _add(self, phase, name):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((phase, name, time.perf_counter()))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write out all events currently in the ring buffer."""
+        # popleft is atomic so this is safe while the game thread keeps appending
+        while self.events:
+            phase, name, timestamp = self.events.popleft()
+            self._write_event({'name': name, 'ph': phase, 'pid': self._pid, 'tid': self._tid,
+                               'ts': (timestamp - self._start) * 1000000})
+        self._file.flush()
+
+    def _write_event(self, event):
+        if not self._first:
+            self._file.write(',\n')
+        self._first = False
+        self._file.write(json.dumps(event))
+
+    def close(self):
+        """Stop the writer thread, write any remaining events and finish the file."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._file.write('\n]\n')
+        self._file.close()
+        if self.dropped:
+            print(f'Tracer dropped {self.dropped} events, consider a larger capacity')
@@ -0,0 +1,124 @@
+"""Enemy waves, loaded from resources/waves.json and compiled ahead of time.
+
+The file looks like this:
+    {
+        "caps": {"EnemyPawn": 100, "EnemySlider": 2},   the most of each type that are ever spawned (no cap if left out)
+        "waves": [
+            {
+                "start": 0,        seconds into the game of the first spawn
+                "interval": 2,     seconds between spawns, leave out to only spawn once
+                "repeat": 10,      how many times to spawn, leave out to keep spawning for the rest of the game
+                "amount": 1,       how many enemies each spawn, all at once
+                "enemies": {"EnemyPawn": 100, "EnemySlider": 20}   how likely each type is to be picked
+            }
+        ]
+    }
+
+Compiling looks up the enemy types, turns seconds into ticks and adds up the weights for random.choices() once, so
+all that is left to do every tick is checking which waves are due. A wave with a big amount doesn't need to be built in
+a single tick, the level spreads the enemies over as many ticks as it takes (see Level.SPAWN_BUDGET)."""
+import itertools
+import json
+import random
+from collections import namedtuple
+
+from pyglet import resource
+
+from . import TPS, EnemyPawn, EnemySlider, EnemyTurret
+
+# Enemy types by the names used in the file
+ENEMY_TYPES = {enemy_type.__name__: enemy_type for enemy_type in (EnemyPawn, EnemySlider, EnemyTurret)}
+
+# Cap of the enemy types that don't have one. An integer rather than math.inf, since how many have been spawned is
+# stored in snapshots (see rewind.py) and setting that to the cap (like src/loadtest.py does) has to fit
+UNCAPPED = 2 ** 32 - 1
+
+# start and interval are in ticks, interval is 0 and repeat 1 for waves that only spawn once
+# repeat is None for waves that keep spawning
+Wave = namedtuple('Wave', 'start, interval, repeat, amount, types, weights, cum_weights')
+
+
+class Waves:
+    """Compiled waves, the timeline of when enemies are spawned."""
+
+    def __init__(self, waves, caps):
+        self.waves = list(waves)
+        # Enemy type -> the most that are spawned of it
+        self.caps = caps
+        # Every enemy type, in a fixed order (used by rewind snapshots)
+        self.types = list(ENEMY_TYPES.values())
+
+    def __len__(self):
+        return len(self.waves)
+
+    def __getitem__(self, index) -> Wave:
+        return self.waves[index]
+
+    def due(self, tick):
+        """Indexes of the waves that spawn on tick (0 is the first tick of the game)."""
+        for index, wave in enumerate(self.waves):
+            since = tick - wave.start
+            if since < 0:
+                continue
+            if wave.interval == 0:
+                if since == 0:
+                    yield index
+            elif since % wave.interval == 0 and (wave.repeat is None or since // wave.interval < wave.repeat):
+                yield index
+
+    def choose(self, wave: Wave, spawned):
+        """Picks an enemy type of wave at random, leaving out types that have been spawned as many times as their
+        cap allows (spawned maps type to how many have been). None if every type is at its cap."""
+        types = wave.types
+        if all(spawned[enemy_type] < self.caps[enemy_type] for enemy_type in types):
+            return random.choices(types, cum_weights=wave.cum_weights)[0]
+        # Some are capped, so we have to leave those out
+        allowed = [(enemy_type, weight) for enemy_type, weight in zip(types, wave.weights)
+                   if spawned[enemy_type] < self.caps[enemy_type]]
+        if not allowed:
+            return None
+        types, weights = zip(*allowed)
+        return random.choices(types, weights)[0]
+
+
+def _enemy_type(name):
+    try:
+        return ENEMY_TYPES[name]
+    except KeyError:
+        raise ValueError(f'unknown enemy type {name!r}, expected one of {", ".join(ENEMY_TYPES)}') from None
+
+
+def compile_waves(definition) -> Waves:
+    """Compiles wave definitions (the parsed JSON of a waves file)."""
+    caps = {enemy_type: UNCAPPED for enemy_type in ENEMY_TYPES.values()}
+    for name, cap in definition.get('caps', {}).items():
+        if not 0 <= cap <= UNCAPPED:
+            raise ValueError(f'cap of {name} needs to be between 0 and {UNCAPPED}')
+        caps[_enemy_type(name)] = cap
+
+    waves = []
+    for number, wave in enumerate(definition['waves'], 1):
+        enemies = {_enemy_type(name): weight for name, weight in wave['enemies'].items()}
+        if not enemies or any(weight <= 0 for weight in enemies.values()):
+            raise ValueError(f'wave {number} needs at least one enemy type, all with a weight above 0')
+        interval = round(wave.get('interval', 0) * TPS)
+        repeat = wave.get('repeat', None if interval else 1)
+        if interval == 0 and repeat != 1:
+            raise ValueError(f'wave {number} needs an interval to repeat')
+        amount = wave.get('amount', 1)
+        if amount < 1:
+            raise ValueError(f'wave {number} needs to spawn at least 1 enemy')
+        weights = list(enemies.values())
+        waves.append(Wave(start=round(wave.get('start', 0) * TPS), interval=interval, repeat=repeat, amount=amount,
+                          types=list(enemies), weights=weights, cum_weights=list(itertools.accumulate(weights))))
+    return Waves(waves, caps)
+
+
+def load_waves(filename='waves.json') -> Waves:
+    """Loads and compiles a waves file from the resources."""
+    with resource.file(filename, 'r') as f:
+        return compile_waves(json.load(f))
+
+
+# The waves of the game
+WAVES = load_waves()
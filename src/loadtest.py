@@ -0,0 +1,146 @@
+"""Capacity-planning sweep.
+
+Ramps the number of pawns, sliders and turrets step by step in the real GameWindow loop and records how long
+ticking and drawing takes at each step. Writes the scaling curve as CSV (and a chart if matplotlib is
+installed) and reports the breaking point, ie. the first step where a frame (the ticks since the last draw and the
+draw) no longer fits in 1 / TPS at p99.
+
+Run from the repository root with:
+    python -m src.loadtest --out sweep.csv
+"""
+import argparse
+import csv
+import random
+
+from src.tools import add_headless_argument, use_headless, sandbox_window_class
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pawns-step', type=int, default=25, help='pawns added each step')
+    parser.add_argument('--sliders-step', type=int, default=2, help='sliders added each step')
+    parser.add_argument('--turrets-step', type=int, default=0, help='turrets added each step')
+    parser.add_argument('--max-steps', type=int, default=40, help='give up after this many steps')
+    parser.add_argument('--settle', type=float, default=1.0, help='seconds to wait after spawning before measuring')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds to measure each step')
+    parser.add_argument('--seed', type=int, default=0, help='random seed so runs are comparable')
+    parser.add_argument('--out', default='loadtest.csv', help='CSV file to write the scaling curve to')
+    parser.add_argument('--chart', default=None, help='image file to plot the curve to (default: next to the CSV)')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+    random.seed(args.seed)
+
+    # Imported here so the headless option is respected
+    from pyglet import clock
+    from pyglet.app import run as pyglet_run, exit as pyglet_exit
+    from src.game import TPS, WIDTH, HEIGHT, EnemyPawn, EnemySlider, EnemyTurret, profiler
+
+    budget = 1000 / TPS
+
+    window = sandbox_window_class()(width=WIDTH, height=HEIGHT)
+    window.start_game()
+
+    rows = []
+
+    def start_step(_dt=None):
+        step = len(rows) + 1
+        window.spawn(EnemyPawn, args.pawns_step)
+        window.spawn(EnemySlider, args.sliders_step)
+        window.spawn(EnemyTurret, args.turrets_step)
+        print(f'Step {step}: {step * args.pawns_step} pawns, {step * args.sliders_step} sliders, '
+              f'{step * args.turrets_step} turrets')
+        clock.schedule_once(start_measuring, args.settle)
+
+    def start_measuring(_dt):
+        profiler.clear()
+        clock.schedule_once(finish_step, args.duration)
+
+    def finish_step(_dt):
+        step = len(rows) + 1
+        tick = profiler.summary('tick')
+        draw = profiler.summary('draw')
+        # A whole frame, the ticks since the last draw plus the draw
+        frame = profiler.summary('frame')
+        rows.append({
+            'step': step,
+            'pawns': step * args.pawns_step,
+            'sliders': step * args.sliders_step,
+            'turrets': step * args.turrets_step,
+            'entities': step * (args.pawns_step + args.sliders_step + args.turrets_step),
+            # Projectiles aren't entities, but they cost time too
+            'projectiles': max(profiler.samples['projectiles.live'], default=0),
+            'particles': max(profiler.samples['particles.live'], default=0),
+            'frames': len(profiler.timings['draw']),
+            **{f'tick_{stat}_ms': round(value, 3) for stat, value in tick.items()},
+            **{f'draw_{stat}_ms': round(value, 3) for stat, value in draw.items()},
+            **{f'frame_{stat}_ms': round(value, 3) for stat, value in frame.items()},
+        })
+        # Keep going until the typical (not just the worst) frame is over budget
+        if step >= args.max_steps or frame['p50'] > budget:
+            pyglet_exit()
+        else:
+            start_step()
+
+    start_step()
+    pyglet_run()
+    window.close()
+
+    write_csv(args.out, rows)
+    print(f'Wrote scaling curve to {args.out}')
+    chart = args.chart or args.out.rsplit('.', 1)[0] + '.png'
+    if plot(chart, rows, budget):
+        print(f'Wrote chart to {chart}')
+
+    # The breaking point is the first step where the p99 frame is over budget
+    broken = [row for row in rows if row['frame_p99_ms'] > budget]
+    if broken:
+        row = broken[0]
+        sustained = row['entities'] - args.pawns_step - args.sliders_step - args.turrets_step
+        print(f'Breaking point: {row["entities"]} entities ({row["pawns"]} pawns, {row["sliders"]} sliders, '
+              f'{row["turrets"]} turrets) missed {budget:.1f} ms at p99')
+        print(f'Max sustained entities: {sustained}')
+    else:
+        row = rows[-1]
+        print(f'No breaking point found, {row["entities"]} entities ({row["pawns"]} pawns, {row["sliders"]} sliders, '
+              f'{row["turrets"]} turrets) still fit in {budget:.1f} ms at p99')
+
+
+def write_csv(filename, rows):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def plot(filename, rows, budget):
+    """Plots the scaling curve to filename. Returns False if matplotlib isn't installed."""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib not installed, skipping chart')
+        return False
+
+    entities = [row['entities'] for row in rows]
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for name in ('tick', 'draw', 'frame'):
+        for stat, style in (('p50', '-'), ('p99', '--'), ('max', ':')):
+            ax.plot(entities, [row[f'{name}_{stat}_ms'] for row in rows], style, label=f'{name} {stat}')
+    ax.axhline(budget, color='red', label=f'frame budget ({budget:.1f} ms)')
+    ax.set_xlabel('entities')
+    ax.set_ylabel('ms')
+    ax.set_title('Frame time scaling')
+    ax.legend()
+    fig.savefig(filename)
+    plt.close(fig)
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,20 @@
 import os
 import pickle
+import argparse
 from typing import List
 from collections import namedtuple
 
 from pyglet import clock, resource
 from pyglet.app import run as pyglet_run
+from pyglet.event import EVENT_HANDLED
 from pyglet.window import Window, FPSDisplay
-from pyglet.graphics import Batch
+from pyglet.graphics import Batch, OrderedGroup
 import pymunk
 
-from src.game import (TPS, WIDTH, HEIGHT, Player, GameObject, CollisionType, Level, EnemyPawn, EnemySlider, GameUI,
-                      Pellet, Menu)
+from src.game import (TPS, IDLE_TPS, SUBSTEPS, WIDTH, HEIGHT, Player, GameObject, Actor, CollisionType, Level,
+                      EnemyPawn, EnemySlider, GameUI, Pellet, Menu, Scene, Enemy, SpatialQueries, ProjectileStore,
+                      ParticleSystem, Leaderboard, Rewind, SpectatorPublisher, InputLatency, profiler, animator, Tracer,
+                      GCPolicy, EventBus, analytics)
 
 # A highscore object, easier to sort than having the data in a dict
 Highscore = namedtuple('Highscore', 'name, score')
@@ -20,11 +24,13 @@ Highscore = namedtuple('Highscore', 'name, score')
 class GameWindow(Window):
     """Main game window."""
 
-    def __init__(self, **kwargs):
+    def __init__(self, gc_control=True, **kwargs):
         super().__init__(**kwargs)
 
         # List of current objects that we know of
         self.objects: List[GameObject] = []
+        # Input events go to the objects that subscribed to them here, rather than through the window's handler stack
+        self.event_bus = EventBus()
         # Batches for efficient drawing (each batch can be drawn at once
         # instead of needing to draw every single object individually)
         self.main_batch = Batch()
@@ -35,8 +41,15 @@ class GameWindow(Window):
         # FPS display in bottom left corner
         self.fps_display = FPSDisplay(window=self)
 
-        # Call self.tick() approx 60 times a sec
+        # Keeps the garbage collector from running in the middle of frames
+        self.gc_policy = GCPolicy(profiler, 1 / TPS, enabled=gc_control)
+
+        # Call self.tick() approx 60 times a sec (or self.idle_tick() less often while a menu is up, see
+        # self._switch_scene())
         clock.schedule_interval(self.tick, 1 / TPS)
+        self.idle = False
+        # Time spent ticking since the last draw, which together with the draw is the time of a whole frame
+        self._frame_ticks = 0.0
 
         # Locate setting directory
         # This will be somewhere in AppData on windows and ~/.config on linux etc.
@@ -47,92 +60,136 @@ class GameWindow(Window):
 
         self.highscores_filename = os.path.join(settings_dir, "highscores.pickle")
         # Try loading our highscores or assume we have done if we fail
+        # Every run is kept, the leaderboard sorts them (just to be safe) and keeps them sorted
         try:
             with open(self.highscores_filename, "rb") as f:
-                self.highscores = pickle.load(f)
-            # Sort the highscores just to be safe
-            self.highscores.sort(key=lambda highscore: highscore.score, reverse=True)
+                self.leaderboard = Leaderboard(pickle.load(f))
         except (OSError, IOError):
-            self.highscores = []
+            self.leaderboard = Leaderboard()
 
-        # Vars assigned to later in self.reset
-        self.space = None
-        self.player = None
+        # The physics space lives as long as the window does, only enemies and pellets come and go
+        self.space = pymunk.Space()
+        # Add walls on window edges
+        self._add_walls()
+        # Initialize collisions
+        Pellet.init_collision(self)
+        EnemySlider.init_collision(self)
+
+        # Build the menu and game scenes once up front, so switching between them later is cheap
+        self.menu = Menu(ui_batch=self.ui_batch, cb_start_game=self.start_game, cb_add_highscore=self.add_highscore)
+        # Nothing moves in the menu, so there's no need to tick and redraw it all the time
+        self.menu_scene = Scene(self, idle=True)
+        self.menu_scene.add(self.menu)
+
+        # How long key presses take to make it to the screen
+        self.input_latency = InputLatency(profiler)
+        # Create a player in the middle of the window
+        self.player = Player(pos=(self.width / 2, self.height / 2), player_batch=self.player_batch,
+                             ui_batch=self.ui_batch, input_latency=self.input_latency)
+        # Answers questions about where things are, shared by the UI, level and enemies
+        self.spatial = SpatialQueries(player=self.player)
+        # Add UI which is only the score for now
+        self.ui = GameUI(player=self.player, spatial=self.spatial, ui_batch=self.ui_batch,
+                         background_batch=self.background_batch)
+        self.game_scene = Scene(self, space=self.space)
+        self.game_scene.add(self.player)
+        self.game_scene.add(self.ui)
+        # Every projectile fired by turrets, drawn above enemies and pellets
+        self.projectiles = ProjectileStore(player=self.player, batch=self.main_batch, group=OrderedGroup(2))
+        self.game_scene.add(self.projectiles)
+        # Effects for pickups and slider slams, drawn above everything else in the main batch
+        self.particles = ParticleSystem(batch=self.main_batch, group=OrderedGroup(3))
+        self.game_scene.add(self.particles)
+
+        # The currently active scene (set in self.main_menu() and self.start_game())
+        self.scene = None
+        # Level is recreated for every game in self.start_game()
         self.level = None
-        self.ui = None
-        self.menu = None
+        # Snapshot of every tick of the current game, so we can go back in time
+        self.rewind = Rewind(self)
+        # Streams every tick to spectators if set (see main())
+        self.spectators = None
 
     def save_highscores(self):
-        """Saves self.highscores to self.highscores_filename."""
+        """Saves the highscores of self.leaderboard to self.highscores_filename."""
         with open(self.highscores_filename, "wb") as f:
-            pickle.dump(self.highscores, f)
-
-    def main_menu(self, add_score=None):
-        """Shows the main menu (or a prompt for highscore name if add_score != None)"""
-        # Start by clearing everything
-        self.reset()
-
-        # If we have a score we need to add
-        if add_score is not None:
-            # Inner function that acts as callback for the menu when the player has entered their name
-            def add_highscore(name, score):
-                # If we don't have 10 scores yet or the score if higher than the lowest one
-                if len(self.highscores) < 10 or score >= self.highscores[-1].score:
-                    # Add the highscore and sort them
-                    self.highscores.append(Highscore(name, score))
-                    self.highscores.sort(key=lambda highscore: highscore.score, reverse=True)
-                    # If we have more than 9 then remove the last one
-                    if len(self.highscores) > 9:
-                        self.highscores.pop()
-                    # Save the highscores to make
-                    self.save_highscores()
-                # Go back to main menu
-                self.main_menu()
-
-            self.menu = Menu(highscores=self.highscores, ui_batch=self.ui_batch,
-                             add_score=add_score, cb_add_highscore=add_highscore)
-        else:
-            self.menu = Menu(highscores=self.highscores, ui_batch=self.ui_batch, cb_start_game=self.start_game)
-        self._add_game_object(self.menu)
-
-    def reset(self):
-        # Clear handlers
-        try:
-            while True:
-                self.pop_handlers()
-        except Exception as e:
-            print(e)
-        # Clear space
-        self.space = pymunk.Space()
-        # Remove objects
-        for obj in self.objects:
-            obj.delete()
-        self.objects = []
+            pickle.dump(self.leaderboard.highscores, f)
+
+    def main_menu(self, add_score=None, own_rank=None):
+        """Shows the main menu (or a prompt for highscore name if add_score != None)
+
+        The leaderboard is shown around own_rank if given."""
+        # Tearing down the game and building the menu can take a while, so time it
+        with profiler.measure('main_menu'):
+            self._main_menu(add_score, own_rank)
+
+    def _main_menu(self, add_score, own_rank):
+        if self.scene is self.game_scene:
+            analytics.end_game()
+        # Pick which menu to show before it becomes visible
+        self.menu.show(leaderboard=self.leaderboard, add_score=add_score, own_rank=own_rank)
+        self._switch_scene(self.menu_scene)
+        # Clean up after the game while nothing is moving
+        self.gc_policy.leave_gameplay()
+
+    def add_highscore(self, name, score):
+        """Callback for the menu when the player has entered their name."""
+        # Every score makes it onto the leaderboard, in its sorted place
+        rank = self.leaderboard.add(Highscore(name, score))
+        # Save the highscores to make
+        self.save_highscores()
+        # Go back to main menu, showing where the score ended up
+        self.main_menu(own_rank=rank)
+
+    def _switch_scene(self, scene: Scene):
+        """Deactivates the current scene (removing anything that isn't part of it) and activates scene instead."""
+        if self.scene is not None:
+            # Remove objects that were added while the scene was active (level, enemies, pellets)
+            for obj in list(self.objects):
+                if obj not in self.scene.objects:
+                    self._remove_game_object(obj)
+            self.scene.deactivate()
+        self.scene = scene
+        scene.activate()
+        self.objects = list(scene.objects)
+        self._schedule_ticks()
+
+    def _schedule_ticks(self):
+        """Ticks the current scene at TPS, or if it's idle only at IDLE_TPS while something in it is animating.
+
+        pyglet redraws the window whenever a scheduled function has been called, or when there has been an event and
+        self.invalid is set. So while idle we tick less often (or not at all) and clear self.invalid after every
+        draw, which means an idle scene is only redrawn when it changes."""
+        clock.unschedule(self.tick)
+        clock.unschedule(self.idle_tick)
+        self.idle = self.scene.idle
+        if not self.idle:
+            clock.schedule_interval(self.tick, 1 / TPS)
+        elif any(obj.animating for obj in self.objects):
+            clock.schedule_interval(self.idle_tick, 1 / IDLE_TPS)
+        # Whatever happens, the scene has to be drawn once
+        self.invalid = True
 
     def start_game(self):
-        # Start by clearing everything
-        self.reset()
+        # Switch to the game scene, which already contains the player and UI
+        self._switch_scene(self.game_scene)
 
-        # Create a player in the middle of the window
-        self.player = Player(pos=(self.width / 2, self.height / 2), player_batch=self.player_batch,
-                             ui_batch=self.ui_batch)
-        self._add_game_object(self.player)
+        # Put the player in the middle of the window and reset the score
+        self.player.reset((self.width / 2, self.height / 2))
+        self.ui.reset()
+        self.projectiles.clear()
+        self.particles.clear()
 
         # Add a level that controls enemy and pellet spawning
-        self.level = Level(player=self.player, batch=self.main_batch)
+        self.level = Level(player=self.player, spatial=self.spatial, projectiles=self.projectiles,
+                           particles=self.particles, batch=self.main_batch)
         self._add_game_object(self.level)
+        # Snapshots of the last game are no use in this one
+        self.rewind.clear()
+        analytics.begin_game()
 
-        # Add UI which is only the score for now
-        self.ui = GameUI(player=self.player, space=self.space, ui_batch=self.ui_batch,
-                         background_batch=self.background_batch)
-        self._add_game_object(self.ui)
-
-        # Add walls on window edges
-        self._add_walls()
-
-        # Initialize collisions
-        Pellet.init_collision(self)
-        EnemySlider.init_collision(self)
+        # Only collect garbage when we have time to spare from now on
+        self.gc_policy.enter_gameplay()
 
     def _add_walls(self):
         """Adds four walls on window edges."""
@@ -153,7 +210,7 @@ class GameWindow(Window):
 
         # When player touches a wall we want to go to the menu to add the score
         collision_handler = self.space.add_collision_handler(CollisionType.Player, CollisionType.WallKill)
-        collision_handler.post_solve = lambda *_: self.main_menu(add_score=self.ui.score)
+        collision_handler.post_solve = self._on_player_wall_kill
 
         sensor_walls = [
             pymunk.Segment(static_body, (0, 0), (WIDTH, 0), 0.0),
@@ -166,22 +223,51 @@ class GameWindow(Window):
             wall.collision_type = CollisionType.WallSensor
             wall.filter = pymunk.ShapeFilter(categories=CollisionType.WallSensor)
 
+    def _on_player_wall_kill(self, *_):
+        """Collision callback for when the player touches a kill wall."""
+        # The player can touch more than one wall in the same step, but we only want to end the game once
+        if self.scene is not self.game_scene:
+            return
+        with profiler.trace('collision Player/WallKill'):
+            analytics.event('death', self.player.pos, score=self.ui.score)
+            self.main_menu(add_score=self.ui.score)
+
     def tick(self, dt: float):
+        # Time the whole tick so tools (eg. loadtest.py) can tell if we keep up with TPS
+        self.gc_policy.begin_tick()
+        with profiler.measure('tick'):
+            self._tick(dt)
+        self._frame_ticks += profiler.timings['tick'][-1]
+        self.gc_policy.end_tick()
+
+    def idle_tick(self, dt: float):
+        """Ticks the objects of an idle scene, which don't have any physics, enemies or anything to snapshot."""
+        with profiler.measure('idle_tick'):
+            for obj in self.objects:
+                obj.tick(dt)
+
+    def _tick(self, dt: float):
+        # Forget last tick's spatial queries, since everything has moved since then
+        with profiler.trace('spatial'):
+            self.spatial.begin_tick()
+        # Animations follow game time, so they line up with the timers of the game
+        animator.advance(dt)
+
         # Objects that we need to add (enemy or pellets from Level)
         to_add: List[GameObject] = []
 
         # Tick each object and collect new objects they may have spawned
         for obj in self.objects:
-            obj.tick(dt)
-            to_add.extend(obj.new_objects)
-            obj.new_objects = []
+            with profiler.trace(type(obj).__name__):
+                obj.tick(dt)
+            if obj.new_objects:
+                to_add.extend(obj.new_objects)
+                # Back to the shared empty tuple
+                obj.new_objects = ()
 
         # Delete/remove dead objects
         for to_remove in [obj for obj in self.objects if obj.dead]:
-            # Make sure to delete it properly (pyglets sprites need this)
-            to_remove.delete()
-            # Remove our tracking of the object
-            self.objects.remove(to_remove)
+            self._remove_game_object(to_remove)
 
         # Add new objects
         for obj in to_add:
@@ -190,44 +276,192 @@ class GameWindow(Window):
         # Run physics in overdrive to get proper segment collision at high velocity
         # If this wasn't done, the player could glitch through a wall if
         # the velocity is higher than the distance to the wall + it's depth
-        for i in range(10):
-            self.space.step(dt)
+        # Only the game scene has physics, and we stop as soon as the game ends (in a collision callback)
+        space = self.scene.space
+        if space is not None:
+            for i in range(SUBSTEPS):
+                if self.scene.space is not space:
+                    break
+                with profiler.trace('space.step'):
+                    space.step(dt)
+
+        # Move sprites to where their bodies ended up, skipping any that are outside the window
+        with profiler.trace('cull'):
+            self._cull()
+
+        # Collect analytics and snapshot the tick, unless the game ended during it
+        if self.scene is self.game_scene:
+            with profiler.measure('analytics'):
+                analytics.collect(self.objects)
+            with profiler.measure('rewind.capture'):
+                self.rewind.capture()
+            if self.spectators is not None:
+                with profiler.measure('spectator.publish'):
+                    self.spectators.publish(*self.rewind.latest())
+
+    def rewind_to(self, tick):
+        """Puts the game back to how it was at tick (see self.rewind for which ticks are available)."""
+        self.rewind.restore(tick)
+        # Show everything where it was right away, rather than after the next tick
+        self._cull()
+
+    def _cull(self):
+        """Culling stage, syncs each actor's sprite with its body or hides it if it's off screen."""
+        visible = 0
+        culled = 0
+        for obj in self.objects:
+            if isinstance(obj, Actor):
+                if obj.sync_sprite():
+                    visible += 1
+                else:
+                    culled += 1
+        profiler.sample('actors.visible', visible)
+        profiler.sample('actors.culled', culled)
 
     def _add_game_object(self, obj: GameObject):
         """Adds an object to be internally tracked and handled
 
-        Add an object to self.objects, make sure its event handlers are handled, and optionally add their body/shape to the physics space.
+        Add an object to self.objects, subscribe its event handlers, and optionally add their body/shape to the physics space.
         """
         self.objects.append(obj)
-        for handler in obj.event_handlers:
-            self.push_handlers(handler)
+        self.event_bus.subscribe(obj, obj.event_handlers)
         if hasattr(obj, 'body'):
             self.space.add(obj.body)
         if hasattr(obj, 'shape'):
             self.space.add(obj.shape)
+        # Keep track of where enemies are, so we don't spawn new ones on top of them
+        if isinstance(obj, Enemy):
+            self.spatial.track(obj)
+
+    def _remove_game_object(self, obj: GameObject):
+        """Stops tracking an object added with self._add_game_object and deletes it."""
+        # Its animations have nothing left to animate
+        animator.stop(obj)
+        # Make sure to delete it properly (pyglets sprites need this)
+        obj.delete()
+        self.objects.remove(obj)
+        self.event_bus.unsubscribe(obj)
+        if hasattr(obj, 'body'):
+            self.space.remove(obj.body)
+        if hasattr(obj, 'shape'):
+            self.space.remove(obj.shape)
+        if isinstance(obj, Enemy):
+            self.spatial.untrack(obj)
 
     def on_draw(self):
+        if self.idle:
+            with profiler.measure('idle_draw'):
+                self._draw_idle()
+            # A press applied in the tick that ended the game is on screen now, as the menu
+            self.input_latency.drawn()
+            # Don't redraw on events (eg. moving the mouse) until something actually changes
+            self.invalid = False
+            return
+        # Cosmetic animations are only worked out when they're about to be seen
+        with profiler.measure('animate'):
+            animator.apply()
+        with profiler.measure('draw'):
+            self._draw()
+        # The worst ticks and the worst draws don't happen in the same frames, so frames are timed as a whole too
+        profiler.record('frame', self._frame_ticks + profiler.timings['draw'][-1])
+        self._frame_ticks = 0.0
+        # Key presses applied since the last frame are now on screen (well, as soon as pyglet flips the buffers)
+        self.input_latency.drawn()
+        # Use whatever is left of the frame to collect garbage
+        self.gc_policy.idle()
+
+    def _draw_idle(self):
+        # Idle scenes only have UI, so skip the other batches and the FPS display (which would be meaningless anyway)
+        self.clear()
+        self.ui_batch.draw()
+
+    # Input goes to whatever subscribed to it on the event bus
+    def on_key_press(self, symbol, modifiers):
+        if self.event_bus.dispatch('on_key_press', symbol, modifiers):
+            return EVENT_HANDLED
+        # Escape still closes the window
+        return super().on_key_press(symbol, modifiers)
+
+    # These may also change what an idle scene looks like, and so need it to be redrawn
+    def on_key_release(self, symbol, modifiers):
+        self.invalid = True
+        return self.event_bus.dispatch('on_key_release', symbol, modifiers)
+
+    def on_text(self, text):
+        self.invalid = True
+        return self.event_bus.dispatch('on_text', text)
+
+    def on_text_motion(self, motion):
+        self.invalid = True
+        return self.event_bus.dispatch('on_text_motion', motion)
+
+    def on_expose(self):
+        self.invalid = True
+
+    def on_resize(self, width, height):
+        super().on_resize(width, height)
+        self.invalid = True
+
+    def _draw(self):
         # First clear the canvas
         self.clear()
         # Then draw any background
-        self.background_batch.draw()
+        with profiler.trace('background_batch.draw'):
+            self.background_batch.draw()
         # Then draw the main batch (level, enemies, pellets etc)
-        self.main_batch.draw()
+        with profiler.trace('main_batch.draw'):
+            self.main_batch.draw()
         # Then draw the player on top
-        self.player_batch.draw()
+        with profiler.trace('player_batch.draw'):
+            self.player_batch.draw()
         # Then draw the UI on top
-        self.ui_batch.draw()
+        with profiler.trace('ui_batch.draw'):
+            self.ui_batch.draw()
         # And finally the FPS display
         self.fps_display.draw()
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Welcome to hell')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a per-frame timeline to FILE (open it in chrome://tracing or ui.perfetto.dev)')
+    parser.add_argument('--no-gc-control', dest='gc_control', action='store_false',
+                        help="let python's garbage collector run whenever it wants, even in the middle of a frame")
+    parser.add_argument('--spectate', metavar='ADDRESS', nargs='?', const=SpectatorPublisher.DEFAULT_ADDRESS,
+                        help='let spectators (src/spectator_viewer.py) watch the game on ADDRESS, either host:port or '
+                             f'unix:path (default {SpectatorPublisher.DEFAULT_ADDRESS}), and print the bandwidth '
+                             'used when exiting')
+    parser.add_argument('--latency', action='store_true',
+                        help='print a histogram of how long key presses took to show up on screen when exiting')
+    parser.add_argument('--analytics', metavar='DIR',
+                        help='write heatmaps and events of every game to DIR (see src/analytics_report.py)')
+    args = parser.parse_args()
+
+    if args.trace:
+        profiler.tracer = Tracer(args.trace)
+    if args.analytics:
+        analytics.start(args.analytics)
+
     # Create our main game window
-    game_window = GameWindow(width=WIDTH, height=HEIGHT)
+    game_window = GameWindow(width=WIDTH, height=HEIGHT, gc_control=args.gc_control)
+    if args.spectate:
+        game_window.spectators = SpectatorPublisher(args.spectate, profiler)
     # And show the main menu
     game_window.main_menu()
+    # Everything created so far lives until the game is closed, so the garbage collector can ignore it
+    game_window.gc_policy.freeze()
     # Then start the pyglet event loop
-    pyglet_run()
+    try:
+        pyglet_run()
+    finally:
+        if args.latency:
+            print(game_window.input_latency.report())
+        if profiler.tracer is not None:
+            profiler.tracer.close()
+        if game_window.spectators is not None:
+            game_window.spectators.close()
+            print(game_window.spectators.report())
+        analytics.close()
 
 
 # Call main() if file was run directly
@@ -0,0 +1,93 @@
+"""Rewind round trip check.
+
+Plays a game with a fixed crowd of enemies (a bot holds a random movement key and the player is put back in the middle
+instead of dying) and measures how long capturing a snapshot takes every tick. Every so often it rewinds a random
+number of ticks with GameWindow.rewind_to() and checks that a snapshot of the restored game is the same as the one
+that was captured for that tick. Fails if any restore didn't put everything back, or if capturing takes longer than
+the budget at p99.
+
+Run from the repository root with:
+    python -m src.rewind_check --headless
+"""
+import argparse
+import random
+import sys
+
+from src.tools import add_headless_argument, use_headless, sandbox_window_class
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pawns', type=int, default=110, help='pawns to spawn')
+    parser.add_argument('--sliders', type=int, default=8, help='sliders to spawn')
+    parser.add_argument('--turrets', type=int, default=8, help='turrets to spawn')
+    parser.add_argument('--ticks', type=int, default=3000, help='ticks to play')
+    parser.add_argument('--rewind-every', type=int, default=100, help='ticks between rewinds')
+    parser.add_argument('--budget', type=float, default=1.0, help='fail if capturing takes longer (in ms) at p99')
+    parser.add_argument('--seed', type=int, default=0, help='random seed so runs are comparable')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+    random.seed(args.seed)
+
+    # Imported here so the headless option is respected
+    from src.game import TPS, WIDTH, HEIGHT, Player, EnemyPawn, EnemySlider, EnemyTurret, profiler
+
+    window = sandbox_window_class()(width=WIDTH, height=HEIGHT)
+    window.start_game()
+    window.spawn(EnemyPawn, args.pawns)
+    window.spawn(EnemySlider, args.sliders)
+    window.spawn(EnemyTurret, args.turrets)
+    rewind = window.rewind
+
+    # Run towards a random direction, the movement keys get changed every few seconds so keep up with them
+    direction = random.choice(list(Player.MOVEMENT_DELTAS))
+    held = None
+    rewinds = 0
+    failed = 0
+    for tick in range(1, args.ticks + 1):
+        wanted = window.player.keys[direction]
+        if wanted != held:
+            if held is not None:
+                window.on_key_release(held, 0)
+            window.on_key_press(wanted, 0)
+            held = wanted
+        window._tick(1 / TPS)
+        window.on_draw()
+
+        if tick % args.rewind_every == 0:
+            to = random.randint(rewind.oldest, rewind.newest)
+            expected = rewind.snapshot(to)
+            window.rewind_to(to)
+            differences = rewind.current().differences(expected)
+            rewinds += 1
+            if differences:
+                failed += 1
+                print(f'FAIL: rewinding to tick {to} (from {tick}) put back {len(differences)} things differently:')
+                for difference in differences[:10]:
+                    print(f'  {difference}')
+    entities = len(rewind.current().entities)
+    window.close()
+
+    capture = profiler.summary('rewind.capture')
+    print(f'Capturing {entities} entities took p50 {capture["p50"]:.3f} ms, p99 {capture["p99"]:.3f} ms, '
+          f'max {capture["max"]:.3f} ms over the last {len(profiler.timings["rewind.capture"])} ticks')
+    ok = True
+    if failed:
+        print(f'FAIL: {failed} of {rewinds} rewinds didn\'t restore the snapshot they were rewound to')
+        ok = False
+    else:
+        print(f'OK: {rewinds} rewinds restored the snapshot they were rewound to')
+    if capture['p99'] > args.budget:
+        print(f'FAIL: capturing took longer than {args.budget} ms at p99')
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
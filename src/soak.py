@@ -0,0 +1,235 @@
+"""Soak test.
+
+Plays thousands of short games in a row with a bot that runs straight into a kill wall, enters a name for its
+highscore and starts the next game, the same way a player would. Every so often (always at the main menu, right after
+a highscore was added) it records the memory use of the process (RSS), the number of live objects of each type and
+how many vertices are allocated in the window's batches. At the end it compares the last sample with the first one
+after a warm up, and fails if anything kept growing.
+
+Run from the repository root with:
+    python -m src.soak --headless --sessions 2000
+"""
+import argparse
+import csv
+import gc
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import pyglet
+
+from src.tools import add_headless_argument, use_headless
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1000, help='games to play')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds instead')
+    parser.add_argument('--max-ticks', type=int, default=1200,
+                        help='end a game after this many ticks if the bot is still alive')
+    parser.add_argument('--sample-every', type=int, default=50, help='games between samples')
+    parser.add_argument('--warmup', type=int, default=50, help='games to play before the first (baseline) sample')
+    parser.add_argument('--max-rss-growth', type=float, default=8.0, help='fail if RSS grows by more MiB than this')
+    parser.add_argument('--max-object-growth', type=int, default=200,
+                        help='fail if the number of live objects of any type grows by more than this')
+    parser.add_argument('--tracemalloc', type=int, default=0, metavar='N',
+                        help='trace allocations (slow) and show the N source lines whose memory grew the most')
+    parser.add_argument('--seed', type=int, default=0, help='random seed so runs are comparable')
+    parser.add_argument('--out', default=None, help='CSV file to write every sample to')
+    add_headless_argument(parser)
+    return parser.parse_args()
+
+
+def rss():
+    """Current resident set size of the process in bytes (or the peak if the current one isn't available)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Linux reports the peak in KiB, macOS in bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def allocated_vertices(batches):
+    """How many vertices are allocated in batches, whether they belong to visible vertex lists or not."""
+    total = 0
+    for batch in batches:
+        for domains in batch.group_map.values():
+            for domain in domains.values():
+                total += sum(domain.allocator.sizes)
+    return total
+
+
+def vertex_lists(objects):
+    """Number of live pyglet vertex lists in a Counter of live objects per type name."""
+    return objects['VertexList'] + objects['IndexedVertexList']
+
+
+def main():
+    args = parse_args()
+    use_headless(args)
+    random.seed(args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    # Imported here so the headless option is respected
+    from pyglet.window import key
+    from src.main import GameWindow
+    from src.game import TPS, WIDTH, HEIGHT, Player, Leaderboard, profiler
+
+    # noinspection PyAbstractClass
+    class SoakWindow(GameWindow):
+        """GameWindow that keeps its highscores away from the real ones."""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.highscores_filename = os.path.join(tempfile.mkdtemp(), 'highscores.pickle')
+            self.leaderboard = Leaderboard()
+
+        def add_highscore(self, name, score):
+            # Every run is kept on the leaderboard by design, so start every game with an empty one to not count
+            # that as a leak
+            self.leaderboard = Leaderboard()
+            super().add_highscore(name, score)
+
+    window = SoakWindow(width=WIDTH, height=HEIGHT)
+    batches = [window.main_batch, window.player_batch, window.ui_batch, window.background_batch]
+    window.main_menu()
+
+    # Run the window like pyglet's event loop would (so everything that's scheduled or unscheduled on the clock is
+    # handled the same way), but as fast as possible by telling the clock that 1 / TPS sec passed every step
+    clock = pyglet.clock.get_default()
+    now = clock.time()
+    clock.time = lambda: now
+
+    def step():
+        nonlocal now
+        now += 1 / TPS
+        window.dispatch_events()
+        if clock.call_scheduled_functions(clock.update_time()) or window.invalid:
+            window.on_draw()
+
+    def play_session():
+        """Plays a single game, from pressing space in the main menu to entering a name for the highscore."""
+        window.dispatch_event('on_key_release', key.SPACE, 0)
+        step()
+        # Run towards a random wall
+        direction = random.choice(list(Player.MOVEMENT_DELTAS))
+        held = None
+        for _ in range(args.max_ticks):
+            if window.scene is not window.game_scene:
+                break
+            # The movement keys get changed every few seconds, so keep holding whichever one is right now
+            wanted = window.player.keys[direction]
+            if wanted != held:
+                if held is not None:
+                    window.dispatch_event('on_key_release', held, 0)
+                window.dispatch_event('on_key_press', wanted, 0)
+                held = wanted
+            step()
+        else:
+            # Got stuck somewhere (eg. behind a crowd of enemies), so end the game like a kill wall would
+            window.main_menu(add_score=window.ui.score)
+        if held is not None:
+            window.dispatch_event('on_key_release', held, 0)
+        step()
+        # Type a name and submit it
+        window.dispatch_event('on_text', 'soak')
+        window.dispatch_event('on_key_release', key.ENTER, 0)
+        step()
+
+    def take_sample(session):
+        gc.collect()
+        return {
+            'session': session,
+            'seconds': round(time.perf_counter() - start, 1),
+            'rss_mib': round(rss() / 2 ** 20, 2),
+            'objects': Counter(type(obj).__name__ for obj in gc.get_objects()),
+            'vertices': allocated_vertices(batches),
+            'tracemalloc': tracemalloc.take_snapshot() if args.tracemalloc else None,
+        }
+
+    start = time.perf_counter()
+    samples = []
+    session = 0
+    while session < args.sessions:
+        if args.duration is not None and time.perf_counter() - start > args.duration:
+            break
+        play_session()
+        session += 1
+        if session == args.warmup or (session > args.warmup and (session - args.warmup) % args.sample_every == 0):
+            sample = take_sample(session)
+            samples.append(sample)
+            print(f'Session {session} ({sample["seconds"]} s): RSS {sample["rss_mib"]} MiB, '
+                  f'{sum(sample["objects"].values())} objects, {vertex_lists(sample["objects"])} vertex lists, '
+                  f'{sample["vertices"]} vertices')
+    window.close()
+
+    if len(samples) < 2:
+        print(f'Only played {session} games, which is not enough to sample after the warmup of {args.warmup}')
+        sys.exit(2)
+
+    if args.out:
+        write_csv(args.out, samples)
+        print(f'Wrote samples to {args.out}')
+
+    tick = profiler.summary('tick')
+    print(f'Played {session} games, tick p50 {tick["p50"]:.3f} ms, p99 {tick["p99"]:.3f} ms')
+    if not report(samples[0], samples[-1], args):
+        sys.exit(1)
+
+
+def report(baseline, final, args):
+    """Prints what grew between the baseline and final sample. Returns False if anything grew too much."""
+    ok = True
+    rss_growth = final['rss_mib'] - baseline['rss_mib']
+    print(f'RSS: {baseline["rss_mib"]} -> {final["rss_mib"]} MiB ({rss_growth:+.2f})')
+    if rss_growth > args.max_rss_growth:
+        print(f'FAIL: RSS grew by more than {args.max_rss_growth} MiB')
+        ok = False
+
+    vertex_growth = final['vertices'] - baseline['vertices']
+    print(f'Allocated vertices: {baseline["vertices"]} -> {final["vertices"]} ({vertex_growth:+})')
+    if vertex_growth > 0:
+        print('FAIL: vertices are allocated in the batches and never freed')
+        ok = False
+
+    growth = final['objects'] - baseline['objects']
+    if growth:
+        print('Live objects that grew:')
+        for name, amount in growth.most_common(10):
+            print(f'  {name}: {baseline["objects"][name]} -> {final["objects"][name]} (+{amount})')
+    if vertex_lists(growth):
+        print('FAIL: vertex lists are created and never deleted')
+        ok = False
+    too_many = [name for name, amount in growth.items() if amount > args.max_object_growth]
+    if too_many:
+        print(f'FAIL: more than {args.max_object_growth} new live objects of {", ".join(too_many)}')
+        ok = False
+
+    if final['tracemalloc'] is not None:
+        print('Source lines whose memory grew the most:')
+        for stat in final['tracemalloc'].compare_to(baseline['tracemalloc'], 'lineno')[:args.tracemalloc]:
+            print(f'  {stat}')
+
+    print('OK: memory stayed flat' if ok else 'FAIL: memory kept growing')
+    return ok
+
+
+def write_csv(filename, samples):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['session', 'seconds', 'rss_mib', 'objects', 'vertex_lists', 'vertices'])
+        for sample in samples:
+            writer.writerow([sample['session'], sample['seconds'], sample['rss_mib'],
+                             sum(sample['objects'].values()), vertex_lists(sample['objects']), sample['vertices']])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Spectator viewer.
+
+Watches a game that is being played with --spectate, drawing it with the same sprites as the game itself.
+
+Run from the repository root with:
+    python -m src.spectator_viewer 127.0.0.1:7777
+"""
+import argparse
+import queue
+import socket
+import threading
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('address', nargs='?', default='127.0.0.1:7777',
+                        help='address the game is spectated on, either host:port or unix:path')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Imported here so --help works without opening a window
+    from pyglet import clock
+    from pyglet.app import run as pyglet_run, exit as pyglet_exit
+    from pyglet.graphics import Batch, OrderedGroup
+    from pyglet.sprite import Sprite
+    from pyglet.text import Label
+    from pyglet.window import Window
+    from src.game import TPS, WIDTH, HEIGHT, Player, resources
+    from src.game.rewind import decode, KIND_PLAYER, KIND_PAWN, KIND_SLIDER, KIND_PELLET, KIND_TURRET
+    from src.game.spectator import parse_address, FRAME_HEADER
+
+    def receive(address, frames: queue.Queue):
+        """Reads snapshots from the game into frames until the connection closes (then puts None)."""
+        kind, address = parse_address(address)
+        if kind == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            stream = sock.makefile('rb')
+            while True:
+                header = stream.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                length, = FRAME_HEADER.unpack(header)
+                data = stream.read(length)
+                if len(data) < length:
+                    break
+                frames.put(data)
+        except OSError as e:
+            print(f'Connection failed: {e}')
+        finally:
+            sock.close()
+            frames.put(None)
+
+    window = Window(width=WIDTH, height=HEIGHT, caption='Welcome to hell (spectating)')
+    batch = Batch()
+    # Same order as the game draws them in
+    images = {
+        KIND_PAWN: (resources.enemy_pawn_image, OrderedGroup(0)),
+        KIND_SLIDER: (resources.enemy_slider_image, OrderedGroup(0)),
+        KIND_TURRET: (resources.enemy_turret_image, OrderedGroup(0)),
+        KIND_PELLET: (resources.pellet_image, OrderedGroup(1)),
+        KIND_PLAYER: (resources.player_image, OrderedGroup(2)),
+    }
+    key_group = OrderedGroup(3)
+    score_label = Label('Waiting for the game...', font_name='m5x7', font_size=48, x=WIDTH - 10, y=HEIGHT,
+                        anchor_x='right', anchor_y='top', batch=batch)
+
+    frames = queue.Queue()
+    threading.Thread(target=receive, args=(args.address, frames), daemon=True).start()
+
+    # Entity id -> Sprite, and the key sprites around the player
+    sprites = {}
+    key_sprites = {}
+    state = {'keyframe': None}
+
+    def show(snapshot):
+        for entity_id in list(sprites):
+            if entity_id not in snapshot.entities:
+                sprites.pop(entity_id).delete()
+        for entity_id, (kind, fields) in snapshot.entities.items():
+            x, y, _angle, _vx, _vy, _angular_velocity, rotation, r, g, b = fields[:10]
+            sprite = sprites.get(entity_id)
+            if sprite is None:
+                image, group = images[kind]
+                sprite = sprites[entity_id] = Sprite(img=image, batch=batch, group=group)
+            sprite.update(x=x, y=y, rotation=rotation)
+            sprite.color = (r, g, b)
+            if kind == KIND_PLAYER:
+                # Show which keys move the player, like the game does
+                for direction, key in zip(Player.MOVEMENT_DELTAS, fields[10:14]):
+                    key_sprite = key_sprites.get(direction)
+                    if key_sprite is None:
+                        key_sprite = key_sprites[direction] = Sprite(img=resources.key_glyph_images['W'],
+                                                                     batch=batch, group=key_group)
+                    key_sprite.image = resources.key_glyph_images[chr(key).upper()]
+                    offset = Player.KEY_SPRITE_OFFSETS[direction]
+                    key_sprite.update(x=x + offset[0], y=y + offset[1])
+        text = f'Score: {snapshot.score}'
+        if score_label.text != text:
+            score_label.text = text
+
+    def update(_dt):
+        # Only the newest snapshot is worth showing, but every keyframe has to be kept
+        latest = None
+        while True:
+            try:
+                data = frames.get_nowait()
+            except queue.Empty:
+                break
+            if data is None:
+                print('The game stopped streaming')
+                pyglet_exit()
+                return
+            snapshot = decode(data)
+            if snapshot.keyframe:
+                state['keyframe'] = snapshot
+                latest = snapshot
+            elif state['keyframe'] is not None and snapshot.base_tick == state['keyframe'].tick:
+                latest = snapshot
+        if latest is not None:
+            show(latest if latest.keyframe else state['keyframe'].merge(latest))
+
+    @window.event
+    def on_draw():
+        window.clear()
+        batch.draw()
+
+    clock.schedule_interval(update, 1 / TPS)
+    pyglet_run()
+
+
+if __name__ == '__main__':
+    main()
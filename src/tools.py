@@ -0,0 +1,58 @@
+"""Shared parts of the development tools next to main.py.
+
+The game's modules load their resources as soon as they're imported, which opens a window (or an offscreen context
+with --headless). So a tool calls use_headless() right after parsing its arguments and only imports from src.game and
+src.main after that, this module doesn't import them at the top either.
+"""
+import random
+
+import pyglet
+
+
+def add_headless_argument(parser):
+    """Adds the --headless option that use_headless() reads to an argparse parser."""
+    parser.add_argument('--headless', action='store_true', help='run without a visible window (needs EGL)')
+
+
+def use_headless(args):
+    """Makes pyglet render offscreen if --headless was given, needs to be called before anything creates a window."""
+    if args.headless:
+        pyglet.options['headless'] = True
+
+
+def sandbox_window_class():
+    """Returns a GameWindow subclass that never goes to the menu and only has the enemies that are spawned with its
+    spawn() method."""
+    # Imported here so the headless option is respected
+    from src.main import GameWindow
+    from src.game import WIDTH, HEIGHT
+    from src.game.waves import WAVES
+
+    # noinspection PyAbstractClass
+    class SandboxWindow(GameWindow):
+        def main_menu(self, add_score=None):
+            # The player hitting a kill wall would normally end the game, but we want to keep playing (and rewinding
+            # needs a live player). So just put the player back in the middle instead
+            if self.player is not None:
+                self.player.pos = (WIDTH / 2, HEIGHT / 2)
+                self.player.body.velocity = (0, 0)
+
+        def start_game(self):
+            super().start_game()
+            # Make the level think every enemy type is at its cap, so only we spawn enemies
+            for enemy_type, cap in WAVES.caps.items():
+                self.level.spawned_enemies[enemy_type] = cap
+
+        def spawn(self, enemy_type, amount):
+            """Spawn amount enemies of enemy_type somewhere not right on top of the player."""
+            size_x, size_y = enemy_type.SIZE / 2
+            for _ in range(amount):
+                while True:
+                    pos = (random.uniform(size_x, WIDTH - size_x), random.uniform(size_y, HEIGHT - size_y))
+                    if (self.player.pos - pos).length > 200:
+                        break
+                self._add_game_object(enemy_type(pos=pos, player=self.player, spatial=self.spatial,
+                                                 projectiles=self.projectiles, particles=self.particles,
+                                                 batch=self.main_batch, group=self.level.enemy_group))
+
+    return SandboxWindow